@@ -16,7 +16,34 @@ Supported families:
 Pattern Type: Creational
 """
 
+import asyncio
+import contextlib
+import hashlib
+import heapq
+import hmac
+import importlib
+import itertools
+import json
+import multiprocessing
+import os
+import pickle
+import random
+import sqlite3
+import string
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
 from abc import ABC, abstractmethod
+from array import array
+from collections import deque
+from concurrent import futures
+from functools import lru_cache
+from multiprocessing import shared_memory
+from operator import itemgetter
+from typing import Deque, List, Optional, Tuple
 
 
 # ============================================================
@@ -25,7 +52,14 @@ from abc import ABC, abstractmethod
 
 class MessageSender(ABC):
     @abstractmethod
-    def send_message(self, message: str):
+    def send_message(self, message: str, recipient: Optional[str] = None):
+        pass
+
+    def send_batch(self, messages: List[str]):
+        for message in messages:
+            self.send_message(message)
+
+    def flush(self):
         pass
 
 
@@ -34,33 +68,176 @@ class MessageFormatter(ABC):
     def format_message(self, message: str) -> str:
         pass
 
+    def format_many(self, messages: List[str]) -> List[str]:
+        return [self.format_message(message) for message in messages]
+
+    def format_digest(self, messages: List[str]) -> str:
+        # several messages for one recipient merged into a single one
+        return self.format_message("\n".join(messages))
+
+
+class BufferedMessageSender(MessageSender):
+    """
+    Collects batches and hands them to the transport in one call.
+
+    A buffer is flushed when it reaches `batch_size` messages, or
+    `flush_interval` seconds after its oldest message arrived.
+    """
+
+    def __init__(self, batch_size: int = 500, flush_interval: float = 1.0):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._buffer: List[str] = []
+        self._timer: Optional[threading.Timer] = None
+        self._lock = threading.Lock()
+
+    @abstractmethod
+    def deliver(self, batch: List[str]):
+        pass
+
+    def send_batch(self, messages: List[str]):
+        with self._lock:
+            self._buffer.extend(messages)
+            if len(self._buffer) < self.batch_size:
+                if self._timer is None and self._buffer:
+                    self._timer = threading.Timer(self.flush_interval, self.flush)
+                    self._timer.daemon = True
+                    self._timer.start()
+                return
+            batch = self._take_buffer()
+        self._deliver_chunks(batch)
+
+    def flush(self):
+        with self._lock:
+            batch = self._take_buffer()
+        self._deliver_chunks(batch)
+
+    def _take_buffer(self) -> List[str]:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._buffer = self._buffer, []
+        return batch
+
+    def _deliver_chunks(self, batch: List[str]):
+        for start in range(0, len(batch), self.batch_size):
+            self.deliver(batch[start:start + self.batch_size])
+
+
+class CompiledTemplate:
+    """
+    A message template parsed once into a %-format string and its field
+    names: "Hi {name}, OTP {otp}" -> "Hi %s, OTP %s", ("name", "otp").
+    Rendering is then one tuple and one C-level % call.
+    """
+
+    __slots__ = ("template", "fields", "values", "_format")
+
+    def __init__(self, template: str):
+        pieces: List[str] = []
+        fields: List[str] = []
+        for literal, field, spec, conversion in string.Formatter().parse(template):
+            pieces.append(literal.replace("%", "%%"))
+            if field is None:
+                continue
+            if not field.isidentifier() or spec or conversion:
+                raise ValueError(f"Unsupported placeholder in template: {template!r}")
+            pieces.append("%s")
+            fields.append(field)
+        self.template = template
+        self.fields = tuple(fields)
+        self._format = "".join(pieces)
+        # params dict -> values tuple in field order, done in C by itemgetter
+        if len(fields) > 1:
+            self.values = itemgetter(*fields)
+        elif fields:
+            field = fields[0]
+            self.values = lambda params: (params[field],)
+        else:
+            self.values = lambda params: ()
+
+    def render(self, params: dict) -> str:
+        return self._format % self.values(params)
+
+    def render_values(self, values: tuple) -> str:
+        return self._format % values
+
+
+@lru_cache(maxsize=1024)
+def compile_template(template: str) -> CompiledTemplate:
+    return CompiledTemplate(template)
+
+
+@lru_cache(maxsize=65536)
+def _render_cached(template: str, values: tuple) -> str:
+    # bounded LRU of fully rendered output per (template, params); values are all str
+    return compile_template(template).render_values(values)
+
+
+class TemplateMessageFormatter(MessageFormatter):
+    """
+    Formatter backed by a compiled template. format_message fills the
+    {message} placeholder; render() takes any parameters the template uses.
+    """
+
+    def __init__(self, template: str, cache: bool = True):
+        self.compiled = compile_template(template)
+        self.cache = cache
+
+    def render(self, params: dict) -> str:
+        compiled = self.compiled
+        if not self.cache:
+            return compiled.render(params)
+        values = compiled.values(params)
+        # only str values are cached: 1, 1.0 and True are equal dict keys but
+        # render differently (and other values may be unhashable)
+        for value in values:
+            if type(value) is not str:
+                return compiled.render_values(values)
+        return _render_cached(compiled.template, values)
+
+    def format_message(self, message: str) -> str:
+        return self.render({"message": message})
+
 
 # ============================================================
 # 2. CONCRETE PRODUCTS - EMAIL FAMILY
 # ============================================================
 
-class EmailMessageSender(MessageSender):
-    def send_message(self, message: str):
-        print(f"EMAIL SENT: {message}")
+class EmailMessageSender(BufferedMessageSender):
+    def send_message(self, message: str, recipient: Optional[str] = None):
+        if recipient is None:
+            print(f"EMAIL SENT: {message}")
+        else:
+            print(f"EMAIL SENT to {recipient}: {message}")
 
+    def deliver(self, batch: List[str]):
+        print("\n".join(f"EMAIL SENT: {message}" for message in batch))
 
-class EmailMessageFormatter(MessageFormatter):
-    def format_message(self, message: str) -> str:
-        return f"[EMAIL FORMAT] {message}"
+
+class EmailMessageFormatter(TemplateMessageFormatter):
+    def __init__(self, template: str = "[EMAIL FORMAT] {message}", cache: bool = True):
+        super().__init__(template, cache)
 
 
 # ============================================================
 # 3. CONCRETE PRODUCTS - SMS FAMILY
 # ============================================================
 
-class SMSMessageSender(MessageSender):
-    def send_message(self, message: str):
-        print(f"SMS SENT: {message}")
+class SMSMessageSender(BufferedMessageSender):
+    def send_message(self, message: str, recipient: Optional[str] = None):
+        if recipient is None:
+            print(f"SMS SENT: {message}")
+        else:
+            print(f"SMS SENT to {recipient}: {message}")
 
+    def deliver(self, batch: List[str]):
+        print("\n".join(f"SMS SENT: {message}" for message in batch))
 
-class SMSMessageFormatter(MessageFormatter):
-    def format_message(self, message: str) -> str:
-        return f"[SMS FORMAT] {message}"
+
+class SMSMessageFormatter(TemplateMessageFormatter):
+    def __init__(self, template: str = "[SMS FORMAT] {message}", cache: bool = True):
+        super().__init__(template, cache)
 
 
 # ============================================================
@@ -68,6 +245,8 @@ class SMSMessageFormatter(MessageFormatter):
 # ============================================================
 
 class NotificationFactory(ABC):
+    # name of the delivery channel this family sends through
+    channel = ""
 
     @abstractmethod
     def create_sender(self) -> MessageSender:
@@ -83,6 +262,7 @@ class NotificationFactory(ABC):
 # ============================================================
 
 class EmailNotificationFactory(NotificationFactory):
+    channel = "email"
 
     def create_sender(self) -> MessageSender:
         return EmailMessageSender()
@@ -92,6 +272,7 @@ class EmailNotificationFactory(NotificationFactory):
 
 
 class SMSNotificationFactory(NotificationFactory):
+    channel = "sms"
 
     def create_sender(self) -> MessageSender:
         return SMSMessageSender()
@@ -105,31 +286,2268 @@ class SMSNotificationFactory(NotificationFactory):
 # ============================================================
 
 class NotificationApp:
-    def __init__(self, factory: NotificationFactory):
+    def __init__(self, factory: NotificationFactory,
+                 scheduler: Optional["NotificationScheduler"] = None,
+                 dedup: Optional["DedupWindow"] = None,
+                 processes: int = 0,
+                 outbox: Optional["NotificationOutbox"] = None,
+                 digest: Optional["NotificationDigest"] = None,
+                 metrics: Optional["NotificationMetrics"] = None):
+        self.channel = factory.channel
         self.sender = factory.create_sender()
         self.formatter = factory.create_formatter()
-
-    def notify(self, message: str):
-        print(self.formatter)
-        formatted_message = self.formatter.format_message(message)
-        self.sender.send_message(formatted_message)
+        # with metrics, format and send calls are timed (in this process only)
+        if metrics is not None:
+            self.sender = _InstrumentedSender(self.sender, metrics, self.channel, "send")
+            self.formatter = _InstrumentedFormatter(self.formatter, metrics, self.channel, "format")
+        # a plain inline notify is timed by one wrapper instead of both proxies
+        self._timed_notify = None
+        if metrics is not None and scheduler is None and dedup is None:
+            self._timed_notify = _timed_notify(self.formatter.inner, self.sender.inner, metrics,
+                                               self.channel)
+        # drain_outbox acks a row once it is sent, so sends have to be inline
+        if outbox is not None and (scheduler is not None or processes):
+            raise ValueError("An outbox cannot be combined with a scheduler or process mode")
+        # with a scheduler, sends are queued by priority instead of made inline
+        self.scheduler = scheduler
+        if scheduler is not None:
+            scheduler.add_channel(self.channel, self.sender)
+        # with a dedup window, repeats of a recent message are not sent again
+        self.dedup = dedup
+        # with processes, raw messages go to worker processes that format and send
+        self.pool = None
+        if processes:
+            if scheduler is not None or dedup is not None:
+                raise ValueError("Process mode cannot be combined with a scheduler or dedup window")
+            self.pool = ProcessNotificationPool(factory, processes)
+        # with an outbox, notify only records the message; drain_outbox sends
+        # it (through the dedup window, if any)
+        self.outbox = outbox
+        # with a digest, messages are held per recipient and sent merged
+        if digest is not None and (self.pool is not None or outbox is not None):
+            raise ValueError("Digest mode cannot be combined with process mode or an outbox")
+        self.digest = digest
+        self.digest_failures = 0
+        # one ticker thread sends digests as their windows close, even when
+        # no further notify() calls arrive
+        self._ticker = None
+        if digest is not None:
+            self._stopping = threading.Event()
+            self._ticker = threading.Thread(target=self._tick_digests, name=f"{self.channel}-digests",
+                                            daemon=True)
+            self._ticker.start()
+
+    def _tick_digests(self):
+        while not self._stopping.wait(self.digest.tick):
+            try:
+                self.send_digests()
+            except Exception:
+                pass  # already requeued and counted in digest_failures
+
+    def notify(self, message: str, priority: int = None, recipient: Optional[str] = None):
+        if self.outbox is not None:
+            self.outbox.enqueue(self.channel, message, recipient)
+            return
+        if self.pool is not None:
+            self.pool.submit([(recipient, message)])
+            return
+        if self.digest is not None:
+            self.digest.add(recipient, message)
+            self.send_digests()
+            return
+        if self._timed_notify is not None:
+            self._timed_notify(message, recipient)
+            return
+        self._send(self.formatter.format_message(message), priority, recipient)
+
+    def _send(self, formatted_message: str, priority: Optional[int], recipient: Optional[str]):
+        if self.dedup is not None and not self.dedup.admit(recipient, formatted_message):
+            return
+        if self.scheduler is not None:
+            self.scheduler.submit(self.channel, formatted_message, priority, recipient)
+        else:
+            self.sender.send_message(formatted_message, recipient)
+
+    def notify_many(self, messages: List[str], priority: int = None):
+        if self.outbox is not None:
+            self.outbox.enqueue_many(self.channel, messages)
+            return
+        if self.pool is not None:
+            self.pool.submit([(None, message) for message in messages])
+            return
+        if self.digest is not None:
+            for message in messages:
+                self.digest.add(None, message)
+            self.send_digests()
+            return
+        formatted_messages = self.formatter.format_many(messages)
+        if self.dedup is not None:
+            admit = self.dedup.admit
+            formatted_messages = [message for message in formatted_messages if admit(None, message)]
+        if self.scheduler is not None:
+            self.scheduler.submit_many(self.channel, formatted_messages, priority)
+        else:
+            self.sender.send_batch(formatted_messages)
+
+    def send_digests(self, everything: bool = False) -> int:
+        # sends the digests whose window has closed (all of them with
+        # everything=True); returns how many were sent. A batch that fails
+        # goes back into the digest for the next tick, and the first error
+        # is raised once the others have been tried
+        batches = self.digest.drain() if everything else self.digest.due()
+        format_digest = self.formatter.format_digest
+        sent, error = 0, None
+        for recipient, messages in batches:
+            try:
+                self._send(format_digest(messages), None, recipient)
+            except Exception as exc:
+                self.digest.requeue(recipient, messages)
+                self.digest_failures += 1
+                error = error or exc
+            else:
+                sent += 1
+        if error is not None:
+            raise error
+        return sent
+
+    def flush(self):
+        if self.digest is not None:
+            self.send_digests(everything=True)
+        self.sender.flush()
+
+    def drain_outbox(self, batch_size: int = 500) -> int:
+        # claim -> format and send -> ack, one batch at a time, until this
+        # channel has nothing pending; returns the number of rows sent
+        sent = 0
+        while True:
+            rows = self.outbox.claim(self.channel, batch_size)
+            if not rows:
+                self.sender.flush()
+                return sent
+            try:
+                for _, recipient, message in rows:
+                    self._send(self.formatter.format_message(message), None, recipient)
+                self.sender.flush()
+            except BaseException:
+                self.outbox.release([row[0] for row in rows])
+                raise
+            self.outbox.ack([row[0] for row in rows])
+            sent += len(rows)
+
+    def close(self) -> int:
+        # stops the digest ticker and process mode workers; returns how many
+        # messages the workers handled
+        if self._ticker is not None:
+            self._stopping.set()
+            self._ticker.join()
+        self.flush()
+        return self.pool.close() if self.pool is not None else 0
 
 
 # ============================================================
 # 7. FACTORY SELECTOR (RUNTIME DECISION)
 # ============================================================
 
-def get_factory(factory_type: str) -> NotificationFactory:
-    if factory_type == "email":
-        return EmailNotificationFactory()
-    elif factory_type == "sms":
-        return SMSNotificationFactory()
-    else:
-        raise ValueError("Unsupported notification type")
+class NotificationFactoryRegistry:
+    """
+    Channel name -> factory class, or an "module:ClassName" import path.
+
+    Import paths are resolved on the first get() for that channel, so a
+    family's module and its client libraries cost nothing until used.
+    """
+
+    def __init__(self):
+        self._factories = {}
+
+    def register(self, factory_type: str, target=None):
+        # register(name, cls_or_path), or @register(name) on a factory class
+        if target is None:
+            def decorator(factory_cls):
+                self.register(factory_type, factory_cls)
+                return factory_cls
+            return decorator
+        if factory_type in self._factories:
+            raise ValueError(f"Notification type already registered: {factory_type}")
+        self._factories[factory_type] = target
+        return target
+
+    def _resolve(self, factory_type: str):
+        try:
+            target = self._factories[factory_type]
+        except KeyError:
+            raise ValueError(f"Unsupported notification type: {factory_type}") from None
+        if isinstance(target, str):
+            module_name, _, attribute = target.partition(":")
+            target = getattr(importlib.import_module(module_name), attribute)
+            self._factories[factory_type] = target
+        return target
+
+    def get(self, factory_type: str, *args, **kwargs) -> NotificationFactory:
+        return self._resolve(factory_type)(*args, **kwargs)
+
+    def is_loaded(self, factory_type: str) -> bool:
+        return not isinstance(self._factories[factory_type], str)
+
+    def __contains__(self, factory_type: str) -> bool:
+        return factory_type in self._factories
+
+    def __len__(self) -> int:
+        return len(self._factories)
+
+
+# sibling module, addressed through the package when this file is imported as part of one
+_CHANNELS_MODULE = f"{__package__}.notification_channels" if __package__ else "notification_channels"
+
+notification_registry = NotificationFactoryRegistry()
+notification_registry.register("email", EmailNotificationFactory)
+notification_registry.register("sms", SMSNotificationFactory)
+notification_registry.register("push", f"{_CHANNELS_MODULE}:PushNotificationFactory")
+notification_registry.register("webhook", f"{_CHANNELS_MODULE}:WebhookNotificationFactory")
+notification_registry.register("in-app", f"{_CHANNELS_MODULE}:InAppNotificationFactory")
+
+
+def get_factory(factory_type: str, *args, **kwargs) -> NotificationFactory:
+    return notification_registry.get(factory_type, *args, **kwargs)
+
+
+# ============================================================
+# 8. ASYNC FAMILY (POOLED CONNECTIONS)
+# ============================================================
+
+class AsyncMessageSender(ABC):
+    @abstractmethod
+    async def send_message(self, message: str, recipient: Optional[str] = None):
+        pass
+
+    async def close(self):
+        pass
+
+
+class AsyncConnectionPool:
+    """
+    Persistent connections to one destination (host, port).
+
+    At most `size` connections are opened and at most `max_in_flight`
+    requests are outstanding at once; extra callers wait for a slot.
+    `handshake(reader, writer)` runs once per new connection.
+    """
+
+    def __init__(self, host: str, port: int, size: int = 4, max_in_flight: int = 64,
+                 handshake=None):
+        self.host = host
+        self.port = port
+        self.size = size
+        self.max_in_flight = max_in_flight
+        self.handshake = handshake
+        self.opened = 0
+        self._connections: List["_PooledConnection"] = []
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._connect_lock: Optional[asyncio.Lock] = None
+
+    async def _open(self) -> "_PooledConnection":
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        if self.handshake is not None:
+            try:
+                await self.handshake(reader, writer)
+            except BaseException:
+                writer.close()
+                raise
+        self.opened += 1
+        return _PooledConnection(reader, writer)
+
+    def _slot(self) -> asyncio.Semaphore:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_in_flight)
+            self._connect_lock = asyncio.Lock()
+        return self._slots
+
+    async def _least_busy(self) -> "_PooledConnection":
+        self._connections[:] = [conn for conn in self._connections if not conn.closed]
+        best = min(self._connections, key=lambda conn: conn.in_flight, default=None)
+        if best is not None and (best.in_flight == 0 or len(self._connections) >= self.size):
+            return best
+        async with self._connect_lock:
+            if len(self._connections) < self.size:
+                conn = await self._open()
+                self._connections.append(conn)
+                return conn
+        return min(self._connections, key=lambda conn: conn.in_flight)
+
+    async def pipeline(self, request: bytes, read_response):
+        # request/response on a shared connection; requests are written back to
+        # back and responses matched in order (HTTP/1.1 pipelining)
+        async with self._slot():
+            conn = await self._least_busy()
+            return await conn.pipeline(request, read_response)
+
+    async def exclusive(self, exchange):
+        # `exchange(reader, writer)` gets a connection to itself, for protocols
+        # whose replies gate the next write (SMTP DATA)
+        async with self._slot():
+            conn = await self._least_busy()
+            conn.exclusive_users += 1
+            try:
+                async with conn.exclusive:
+                    return await exchange(conn.reader, conn.writer)
+            except (OSError, asyncio.IncompleteReadError):
+                conn.close()
+                raise
+            finally:
+                conn.exclusive_users -= 1
+
+    async def close(self):
+        for conn in self._connections:
+            conn.close()
+            await conn.wait_closed()
+        self._connections = []
+
+
+class _PooledConnection:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.closed = False
+        self.exclusive = asyncio.Lock()
+        self.exclusive_users = 0
+        # (future, read_response) per request written but not yet answered
+        self._pending: Deque[tuple] = deque()
+        self._reader_task: Optional[asyncio.Task] = None
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._pending) + self.exclusive_users
+
+    async def pipeline(self, request: bytes, read_response):
+        if self.closed:
+            raise ConnectionError("connection closed")
+        future = asyncio.get_running_loop().create_future()
+        # queueing and writing happen without an await in between, so the
+        # pending order always matches the order on the wire
+        self._pending.append((future, read_response))
+        self.writer.write(request)
+        if self._reader_task is None:
+            self._reader_task = asyncio.ensure_future(self._read_responses())
+        await self.writer.drain()
+        return await future
+
+    async def _read_responses(self):
+        try:
+            while self._pending:
+                future, read_response = self._pending[0]
+                response = await read_response(self.reader)
+                self._pending.popleft()
+                if not future.done():
+                    future.set_result(response)
+        except Exception as error:
+            self.close()
+            while self._pending:
+                future, _ = self._pending.popleft()
+                if not future.done():
+                    future.set_exception(ConnectionError(f"connection lost: {error!r}"))
+        finally:
+            self._reader_task = None
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.writer.close()
+
+    async def wait_closed(self):
+        try:
+            await self.writer.wait_closed()
+        except OSError:
+            pass
+
+
+class SMTPError(Exception):
+    pass
+
+
+async def _smtp_reply(reader: asyncio.StreamReader) -> Tuple[int, str]:
+    # multi-line replies are "250-..." lines ending with a "250 ..." line
+    lines = []
+    while True:
+        line = await reader.readline()
+        if not line:
+            raise asyncio.IncompleteReadError(line, None)
+        lines.append(line[4:].decode().rstrip())
+        if line[3:4] != b"-":
+            return int(line[:3]), "\n".join(lines)
+
+
+def _smtp_address(address: str) -> str:
+    # CR/LF would end the command line (or header) early and let the rest
+    # be read as new SMTP commands or headers; <> would break the brackets
+    if any(char in address for char in "\r\n<>"):
+        raise ValueError(f"Invalid email address: {address!r}")
+    return address
+
+
+async def _smtp_handshake(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    code, _ = await _smtp_reply(reader)
+    if code != 220:
+        raise SMTPError(f"unexpected greeting {code}")
+    writer.write(b"EHLO localhost\r\n")
+    code, text = await _smtp_reply(reader)
+    if code != 250:
+        raise SMTPError(f"EHLO rejected with {code}")
+    if "PIPELINING" not in text.upper():
+        raise SMTPError("server does not support PIPELINING")
+
+
+class AsyncEmailMessageSender(AsyncMessageSender):
+    """
+    SMTP over pooled connections. MAIL, RCPT and DATA go out in one write
+    (RFC 2920 pipelining), so each message costs two round trips.
+    """
+
+    def __init__(self, pool: AsyncConnectionPool, from_address: str, default_recipient: str):
+        self.pool = pool
+        self.from_address = _smtp_address(from_address)
+        self.default_recipient = _smtp_address(default_recipient)
+
+    async def send_message(self, message: str, recipient: Optional[str] = None):
+        recipient = _smtp_address(recipient or self.default_recipient)
+        envelope = (f"MAIL FROM:<{self.from_address}>\r\n"
+                    f"RCPT TO:<{recipient}>\r\n"
+                    "DATA\r\n").encode()
+        # dot-stuffing: body lines starting with "." get a second "."
+        body = "\r\n".join("." + line if line.startswith(".") else line
+                           for line in message.splitlines())
+        content = (f"From: <{self.from_address}>\r\nTo: <{recipient}>\r\n"
+                   f"Subject: Notification\r\n\r\n{body}\r\n.\r\n").encode()
+
+        async def exchange(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+            writer.write(envelope)
+            await writer.drain()
+            replies = [await _smtp_reply(reader) for _ in range(3)]
+            if replies[0][0] != 250 or replies[1][0] not in (250, 251) or replies[2][0] != 354:
+                if replies[2][0] == 354:
+                    writer.write(b".\r\n")
+                    await _smtp_reply(reader)
+                writer.write(b"RSET\r\n")
+                await _smtp_reply(reader)
+                raise SMTPError(f"message to {recipient} rejected: {replies}")
+            writer.write(content)
+            await writer.drain()
+            code, text = await _smtp_reply(reader)
+            if code != 250:
+                raise SMTPError(f"message to {recipient} rejected with {code}: {text}")
+
+        await self.pool.exclusive(exchange)
+
+    async def close(self):
+        await self.pool.close()
+
+
+async def _http_response(reader: asyncio.StreamReader) -> Tuple[int, bytes]:
+    status_line = await reader.readline()
+    if not status_line:
+        raise asyncio.IncompleteReadError(status_line, None)
+    status = int(status_line.split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.strip().lower() == "content-length":
+            length = int(value)
+    return status, await reader.readexactly(length)
+
+
+class AsyncSMSMessageSender(AsyncMessageSender):
+    """
+    SMS over an HTTP/1.1 endpoint with keep-alive connections; requests are
+    pipelined on each connection.
+    """
+
+    def __init__(self, pool: AsyncConnectionPool, path: str, default_recipient: str):
+        self.pool = pool
+        self.path = path
+        self.default_recipient = default_recipient
+
+    async def send_message(self, message: str, recipient: Optional[str] = None):
+        body = json.dumps({"to": recipient or self.default_recipient, "message": message}).encode()
+        request = (f"POST {self.path} HTTP/1.1\r\n"
+                   f"Host: {self.pool.host}:{self.pool.port}\r\n"
+                   "Content-Type: application/json\r\n"
+                   f"Content-Length: {len(body)}\r\n\r\n").encode() + body
+        status, response = await self.pool.pipeline(request, _http_response)
+        if not 200 <= status < 300:
+            raise ConnectionError(f"SMS endpoint returned {status}: {response[:200]!r}")
+
+    async def close(self):
+        await self.pool.close()
+
+
+class AsyncNotificationFactory(ABC):
+    """
+    Async counterpart of NotificationFactory. Senders created by one
+    factory share its connection pool; formatting stays synchronous.
+    """
+
+    @abstractmethod
+    def create_sender(self) -> AsyncMessageSender:
+        pass
+
+    @abstractmethod
+    def create_formatter(self) -> MessageFormatter:
+        pass
+
+
+class AsyncEmailNotificationFactory(AsyncNotificationFactory):
+
+    def __init__(self, host: str, port: int, from_address: str, default_recipient: str,
+                 pool_size: int = 4):
+        self.pool = AsyncConnectionPool(host, port, size=pool_size, max_in_flight=pool_size,
+                                        handshake=_smtp_handshake)
+        self.from_address = from_address
+        self.default_recipient = default_recipient
+
+    def create_sender(self) -> AsyncMessageSender:
+        return AsyncEmailMessageSender(self.pool, self.from_address, self.default_recipient)
+
+    def create_formatter(self) -> MessageFormatter:
+        return EmailMessageFormatter()
+
+
+class AsyncSMSNotificationFactory(AsyncNotificationFactory):
+
+    def __init__(self, host: str, port: int, path: str = "/sms", default_recipient: str = "",
+                 pool_size: int = 4, max_in_flight: int = 64):
+        self.pool = AsyncConnectionPool(host, port, size=pool_size, max_in_flight=max_in_flight)
+        self.path = path
+        self.default_recipient = default_recipient
+
+    def create_sender(self) -> AsyncMessageSender:
+        return AsyncSMSMessageSender(self.pool, self.path, self.default_recipient)
+
+    def create_formatter(self) -> MessageFormatter:
+        return SMSMessageFormatter()
+
+
+class AsyncNotificationApp:
+    def __init__(self, factory: AsyncNotificationFactory):
+        self.sender = factory.create_sender()
+        self.formatter = factory.create_formatter()
+
+    async def notify(self, message: str, recipient: Optional[str] = None):
+        await self.sender.send_message(self.formatter.format_message(message), recipient)
+
+    async def notify_many(self, messages: List[str], recipient: Optional[str] = None):
+        # the pool caps how many of these are actually in flight
+        await asyncio.gather(*(self.sender.send_message(message, recipient)
+                               for message in self.formatter.format_many(messages)))
+
+    async def close(self):
+        await self.sender.close()
+
+
+class LocalSMTPServer:
+    """
+    Minimal in-process SMTP stand-in (EHLO/MAIL/RCPT/DATA/RSET/QUIT) with
+    an optional per-message delay; used by the async demo.
+    """
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.messages = 0
+        self.connections = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self) -> int:
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        writer.write(b"220 localhost ESMTP\r\n")
+        try:
+            while True:
+                line = await reader.readline()
+                command = line[:4].upper()
+                if not line or command == b"QUIT":
+                    writer.write(b"221 bye\r\n")
+                    break
+                if command == b"EHLO":
+                    writer.write(b"250-localhost\r\n250 PIPELINING\r\n")
+                elif command == b"DATA":
+                    writer.write(b"354 go ahead\r\n")
+                    while (await reader.readline()) not in (b".\r\n", b""):
+                        pass
+                    await asyncio.sleep(self.delay)
+                    self.messages += 1
+                    writer.write(b"250 queued\r\n")
+                else:
+                    writer.write(b"250 ok\r\n")
+                await writer.drain()
+        finally:
+            writer.close()
+
+
+class LocalSMSEndpoint:
+    """
+    Minimal in-process HTTP/1.1 keep-alive endpoint that accepts SMS posts.
+    """
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.messages = 0
+        self.connections = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self) -> int:
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                length = 0
+                while (line := await reader.readline()) not in (b"\r\n", b""):
+                    name, _, value = line.decode("latin-1").partition(":")
+                    if name.lower() == "content-length":
+                        length = int(value)
+                await reader.readexactly(length)
+                await asyncio.sleep(self.delay)
+                self.messages += 1
+                writer.write(b"HTTP/1.1 202 Accepted\r\nContent-Length: 2\r\n\r\nok")
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+async def demo_async_notifications(messages: int = 2000):
+    smtp, sms = LocalSMTPServer(delay=0.001), LocalSMSEndpoint(delay=0.001)
+    smtp_port, sms_port = await smtp.start(), await sms.start()
+    factories = {
+        "email": AsyncEmailNotificationFactory("127.0.0.1", smtp_port, "noreply@example.com",
+                                               "user@example.com", pool_size=8),
+        "sms": AsyncSMSNotificationFactory("127.0.0.1", sms_port, default_recipient="+910000000000",
+                                           pool_size=4, max_in_flight=64),
+    }
+    for name, factory in factories.items():
+        app = AsyncNotificationApp(factory)
+        start = time.perf_counter()
+        await app.notify_many([f"Your OTP is {i:06d}" for i in range(messages)])
+        elapsed = time.perf_counter() - start
+        print(f"{name:<5}: {messages / elapsed:8.0f} msg/s over {factory.pool.opened} connection(s)")
+        await app.close()
+    print(f"server side: email={smtp.messages} ({smtp.connections} conns),"
+          f" sms={sms.messages} ({sms.connections} conns)")
+    await smtp.stop()
+    await sms.stop()
+
+
+def benchmark_template_render(renders: int = 1_000_000, distinct: int = 1_000):
+    template = "Hi {name}, your OTP is {otp} for order {order_id}"
+    params = [{"name": f"user{i}", "otp": f"{i:06d}", "order_id": i} for i in range(distinct)]
+    cases = [
+        ("str.format_map", lambda p: template.format_map(p)),
+        ("compiled", TemplateMessageFormatter(template, cache=False).render),
+        ("compiled + LRU", TemplateMessageFormatter(template).render),
+    ]
+    for label, render in cases:
+        start = time.perf_counter()
+        for i in range(renders):
+            render(params[i % distinct])
+        elapsed = time.perf_counter() - start
+        print(f"{label:<15}: {elapsed:6.2f} s for {renders} renders"
+              f" ({elapsed / renders * 1e9:.0f} ns each, {distinct} distinct params)")
+
+
+# ============================================================
+# 9. PRIORITY SCHEDULER
+# ============================================================
+
+PRIORITY_OTP = 0
+PRIORITY_TRANSACTIONAL = 1
+PRIORITY_MARKETING = 2
+
+
+class _ChannelQueues:
+    """
+    Per-priority FIFO queues of one channel plus the worker threads that
+    drain them into the channel's sender.
+    """
+
+    def __init__(self, channel: str, sender: MessageSender, weights: Tuple[int, ...],
+                 workers: int, samples: int):
+        self.channel = channel
+        self.sender = sender
+        self.weights = weights
+        self.queues: List[Deque[tuple]] = [deque() for _ in weights]
+        self.condition = threading.Condition()
+        self.stopping = False
+        self.failed = 0
+        # smooth weighted round-robin state, one counter per priority
+        self._current = [0] * len(weights)
+        # most recent time-in-queue samples (seconds) per priority
+        self.waits: List[Deque[float]] = [deque(maxlen=samples) for _ in weights]
+        self.threads = [threading.Thread(target=self._work, name=f"{channel}-sender-{i}", daemon=True)
+                        for i in range(workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def _next(self) -> Tuple[int, tuple]:
+        # every non-empty queue earns its weight, the richest one is served and
+        # pays back the total: priorities get turns in proportion to weight
+        # and no queue is starved (nginx-style smooth weighted round-robin)
+        best, total = -1, 0
+        current = self._current
+        for priority, queue in enumerate(self.queues):
+            if queue:
+                current[priority] += self.weights[priority]
+                total += self.weights[priority]
+                if best < 0 or current[priority] > current[best]:
+                    best = priority
+        current[best] -= total
+        return best, self.queues[best].popleft()
+
+    def _work(self):
+        while True:
+            with self.condition:
+                while not any(self.queues):
+                    if self.stopping:
+                        return
+                    self.condition.wait()
+                priority, (message, recipient, enqueued_at) = self._next()
+            self.waits[priority].append(time.monotonic() - enqueued_at)
+            try:
+                self.sender.send_message(message, recipient)
+            except Exception:
+                self.failed += 1
+
+
+class NotificationScheduler:
+    """
+    Sits between NotificationApp and the MessageSender products.
+
+    Messages wait in per-channel, per-priority queues and are dequeued by
+    weighted fair round-robin (default weights 16:4:1 for OTP,
+    transactional and marketing), so an OTP never waits behind a whole
+    marketing flood. Each channel has its own worker pool.
+    """
+
+    def __init__(self, workers: Optional[dict] = None, weights: Tuple[int, ...] = (16, 4, 1),
+                 default_priority: int = PRIORITY_TRANSACTIONAL, samples: int = 10_000):
+        self.workers = workers or {}
+        self.weights = weights
+        self.default_priority = default_priority
+        self.samples = samples
+        self._channels: dict = {}
+        self._lock = threading.Lock()
+
+    def add_channel(self, channel: str, sender: MessageSender, workers: Optional[int] = None):
+        with self._lock:
+            if channel not in self._channels:
+                self._channels[channel] = _ChannelQueues(
+                    channel, sender, self.weights,
+                    workers or self.workers.get(channel, 4), self.samples)
+
+    def _channel(self, channel: str, priority: Optional[int]) -> Tuple[_ChannelQueues, int]:
+        try:
+            queues = self._channels[channel]
+        except KeyError:
+            raise ValueError(f"Unknown channel: {channel}") from None
+        if priority is None:
+            priority = self.default_priority
+        if not 0 <= priority < len(self.weights):
+            raise ValueError(f"Unknown priority: {priority}")
+        return queues, priority
+
+    def submit(self, channel: str, message: str, priority: Optional[int] = None,
+               recipient: Optional[str] = None):
+        queues, priority = self._channel(channel, priority)
+        with queues.condition:
+            queues.queues[priority].append((message, recipient, time.monotonic()))
+            queues.condition.notify()
+
+    def submit_many(self, channel: str, messages: List[str], priority: Optional[int] = None):
+        queues, priority = self._channel(channel, priority)
+        now = time.monotonic()
+        with queues.condition:
+            queues.queues[priority].extend((message, None, now) for message in messages)
+            queues.condition.notify(len(messages))
+
+    # metrics
+    def queue_depths(self) -> dict:
+        return {channel: [len(queue) for queue in queues.queues]
+                for channel, queues in self._channels.items()}
+
+    def time_in_queue(self, channel: str, priority: int, percentile: float = 99.0) -> float:
+        samples = sorted(self._channels[channel].waits[priority])
+        if not samples:
+            return 0.0
+        return samples[min(len(samples) - 1, int(len(samples) * percentile / 100))]
+
+    def shutdown(self, wait: bool = True):
+        # stops after the queues are drained
+        for queues in self._channels.values():
+            with queues.condition:
+                queues.stopping = True
+                queues.condition.notify_all()
+        if wait:
+            for queues in self._channels.values():
+                for thread in queues.threads:
+                    thread.join()
+
+
+class _SimulatedSender(MessageSender):
+    # stands in for a provider call that takes `latency` seconds
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    def send_message(self, message: str, recipient: Optional[str] = None):
+        time.sleep(self.latency)
+
+
+class _SimulatedSMSFactory(SMSNotificationFactory):
+    def __init__(self, latency: float = 0.001):
+        self.latency = latency
+
+    def create_sender(self) -> MessageSender:
+        return _SimulatedSender(self.latency)
+
+
+def load_test_scheduler(marketing: int = 20_000, otps: int = 200, workers: int = 8):
+    # a marketing flood is queued first, then OTPs trickle in behind it
+    for label, otp_priority in (("FIFO (one priority)", PRIORITY_MARKETING),
+                                ("priority scheduler", PRIORITY_OTP)):
+        scheduler = NotificationScheduler(workers={"sms": workers})
+        app = NotificationApp(_SimulatedSMSFactory(), scheduler)
+        app.notify_many([f"Big sale #{i}" for i in range(marketing)], PRIORITY_MARKETING)
+        for i in range(otps):
+            app.notify(f"Your OTP is {i:06d}", otp_priority)
+            time.sleep(0.001)
+        depth = sum(scheduler.queue_depths()["sms"])
+        scheduler.shutdown()
+        otp_p99 = scheduler.time_in_queue("sms", otp_priority, 99)
+        if otp_priority == PRIORITY_MARKETING:
+            # OTPs share the marketing queue here, so this is that queue's p99
+            print(f"{label:<20}: OTP p99 {otp_p99 * 1e3:.0f} ms (depth {depth} after submit)")
+        else:
+            otp_p50 = scheduler.time_in_queue("sms", otp_priority, 50)
+            marketing_p99 = scheduler.time_in_queue("sms", PRIORITY_MARKETING, 99)
+            print(f"{label:<20}: OTP p50 {otp_p50 * 1e3:.1f} ms, p99 {otp_p99 * 1e3:.1f} ms;"
+                  f" marketing p99 {marketing_p99 * 1e3:.0f} ms (depth {depth} after submit)")
+
+
+# ============================================================
+# 10. RATE LIMITING
+# ============================================================
+
+class TokenBucket:
+    """
+    Token bucket that hands out reservations instead of refusals.
+
+    reserve() always takes a token and returns how long the caller has to
+    wait for it (0.0 when one was available). The balance may go negative,
+    so callers that arrive during a burst are spaced 1/rate apart rather
+    than dropped. The lock only guards a few float operations.
+    """
+
+    __slots__ = ("rate", "capacity", "_tokens", "_updated", "_lock")
+
+    def __init__(self, rate: float, capacity: float):
+        if rate <= 0 or capacity < 1:
+            raise ValueError("rate must be positive and capacity at least 1")
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, now: float) -> float:
+        with self._lock:
+            tokens = self._tokens
+            # `now` may be slightly older than the last update under contention
+            if now > self._updated:
+                tokens += (now - self._updated) * self.rate
+                if tokens > self.capacity:
+                    tokens = self.capacity
+                self._updated = now
+            tokens -= 1.0
+            self._tokens = tokens
+        return 0.0 if tokens >= 0.0 else -tokens / self.rate
+
+    def idle_since(self, now: float) -> bool:
+        # a bucket that has refilled completely carries no state worth keeping
+        return self._tokens + (now - self._updated) * self.rate >= self.capacity
+
+
+class _RecipientBuckets:
+    """
+    One TokenBucket per recipient, spread over lock-striped dicts so that
+    lookups for different recipients rarely share a lock. Full, idle
+    buckets are swept once a stripe grows past `max_per_stripe`.
+    """
+
+    def __init__(self, rate: float, capacity: float, stripes: int = 64,
+                 max_per_stripe: int = 10_000):
+        self.rate = rate
+        self.capacity = capacity
+        self.max_per_stripe = max_per_stripe
+        self._stripes = [({}, threading.Lock()) for _ in range(stripes)]
+
+    def reserve(self, recipient: str, now: float) -> float:
+        buckets, lock = self._stripes[hash(recipient) % len(self._stripes)]
+        bucket = buckets.get(recipient)
+        if bucket is None:
+            with lock:
+                bucket = buckets.get(recipient)
+                if bucket is None:
+                    if len(buckets) >= self.max_per_stripe:
+                        for key in [key for key, old in buckets.items() if old.idle_since(now)]:
+                            del buckets[key]
+                    bucket = buckets[recipient] = TokenBucket(self.rate, self.capacity)
+        return bucket.reserve(now)
+
+
+class _DeferredSends:
+    """
+    Sends that were over the limit, kept in a heap by due time and
+    delivered by one background thread.
+    """
+
+    def __init__(self):
+        self._heap: List[tuple] = []
+        self._order = itertools.count()
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    def schedule(self, due: float, send, message: str, recipient: Optional[str]):
+        with self._condition:
+            heapq.heappush(self._heap, (due, next(self._order), send, message, recipient))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="deferred-sends", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while True:
+                    if self._heap:
+                        delay = self._heap[0][0] - time.monotonic()
+                        if delay <= 0:
+                            break
+                        self._condition.wait(delay)
+                    else:
+                        self._condition.wait()
+                _, _, send, message, recipient = heapq.heappop(self._heap)
+            try:
+                send(message, recipient)
+            except Exception:
+                pass
+
+
+class RateLimitedSender(MessageSender):
+    """
+    Wraps a sender with a per-provider bucket and optional per-recipient
+    buckets. Sends over either limit are deferred until their reserved
+    time instead of being dropped; flush() waits until this sender's
+    deferred sends have gone out.
+
+    A send held back by its recipient's bucket takes its provider token
+    only when that wait is over, so the provider sees it at the time it
+    is actually sent. Deferred sends that raise are counted in
+    `deferred_failed`.
+    """
+
+    def __init__(self, sender: MessageSender, provider: TokenBucket,
+                 recipients: Optional[_RecipientBuckets], deferred: _DeferredSends):
+        self.sender = sender
+        self.provider = provider
+        self.recipients = recipients
+        self.deferred = deferred
+        self.deferred_count = 0
+        self.deferred_failed = 0
+        self._outstanding = 0
+        self._delivered = threading.Condition()
+
+    def send_message(self, message: str, recipient: Optional[str] = None):
+        now = time.monotonic()
+        if recipient is not None and self.recipients is not None:
+            delay = self.recipients.reserve(recipient, now)
+            if delay > 0.0:
+                self._defer(now + delay, self._send_provider, message, recipient)
+                return
+        delay = self.provider.reserve(now)
+        if delay <= 0.0:
+            self.sender.send_message(message, recipient)
+        else:
+            self._defer(now + delay, self._send_deferred, message, recipient)
+
+    def _defer(self, due: float, send, message: str, recipient: Optional[str]):
+        with self._delivered:
+            self.deferred_count += 1
+            self._outstanding += 1
+        self.deferred.schedule(due, send, message, recipient)
+
+    def _send_provider(self, message: str, recipient: Optional[str]):
+        # the recipient's wait is over: now take the provider token
+        now = time.monotonic()
+        delay = self.provider.reserve(now)
+        if delay <= 0.0:
+            self._send_deferred(message, recipient)
+        else:
+            self.deferred.schedule(now + delay, self._send_deferred, message, recipient)
+
+    def _send_deferred(self, message: str, recipient: Optional[str]):
+        try:
+            self.sender.send_message(message, recipient)
+        except Exception:
+            with self._delivered:
+                self.deferred_failed += 1
+        finally:
+            with self._delivered:
+                self._outstanding -= 1
+                if not self._outstanding:
+                    self._delivered.notify_all()
+
+    def flush(self):
+        with self._delivered:
+            while self._outstanding:
+                self._delivered.wait()
+        self.sender.flush()
+
+
+class RateLimitedNotificationFactory(NotificationFactory):
+    """
+    Wraps any NotificationFactory. Every sender it creates shares one
+    provider bucket (`rate` sends/s, bursts of `burst`) and, when
+    `recipient_rate` is given, one bucket per recipient.
+    """
+
+    def __init__(self, factory: NotificationFactory, rate: float, burst: float = 1,
+                 recipient_rate: Optional[float] = None, recipient_burst: float = 1):
+        self._args = (factory, rate, burst, recipient_rate, recipient_burst)
+        self.factory = factory
+        self.channel = factory.channel
+        self.provider = TokenBucket(rate, burst)
+        self.recipients = (_RecipientBuckets(recipient_rate, recipient_burst)
+                           if recipient_rate is not None else None)
+        self.deferred = _DeferredSends()
+
+    def __reduce__(self):
+        # buckets and locks are rebuilt, so each process gets its own limits
+        return type(self), self._args
+
+    def create_sender(self) -> MessageSender:
+        return RateLimitedSender(self.factory.create_sender(), self.provider,
+                                 self.recipients, self.deferred)
+
+    def create_formatter(self) -> MessageFormatter:
+        return self.factory.create_formatter()
+
+
+class _NullSender(MessageSender):
+    def send_message(self, message: str, recipient: Optional[str] = None):
+        pass
+
+
+class _NullSMSFactory(SMSNotificationFactory):
+    def create_sender(self) -> MessageSender:
+        return _NullSender()
+
+
+def benchmark_rate_limiter(threads: int = 64, sends_per_thread: int = 20_000):
+    # rates high enough that nothing is deferred: this is the limiter's own cost
+    factories = [
+        ("no limiter", _NullSMSFactory()),
+        ("provider bucket", RateLimitedNotificationFactory(_NullSMSFactory(), rate=1e12, burst=1e12)),
+        ("provider + recipient", RateLimitedNotificationFactory(
+            _NullSMSFactory(), rate=1e12, burst=1e12, recipient_rate=1e12, recipient_burst=1e12)),
+    ]
+    for label, factory in factories:
+        sender = factory.create_sender()
+
+        def work(worker: int):
+            send = sender.send_message
+            for i in range(sends_per_thread):
+                send("Your OTP is 123456", f"+91{worker:04d}{i % 100:06d}")
+
+        workers = [threading.Thread(target=work, args=(i,)) for i in range(threads)]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - start
+        print(f"{label:<21}: {elapsed / (threads * sends_per_thread) * 1e9:6.0f} ns/send"
+              f" with {threads} threads")
+
+
+# ============================================================
+# 11. DEDUPLICATION
+# ============================================================
+
+class DedupWindow:
+    """
+    Suppresses a (recipient, formatted message) pair that was already sent
+    within the last `window` seconds.
+
+    Keys are 64-bit hashes held in a ring of `buckets` sets, one per
+    window/buckets seconds. A bucket is discarded as a whole when its time
+    slot comes round again, so memory only holds one window of keys and
+    nothing is expired one key at a time. A repeat is caught if it comes
+    within (buckets - 1) / buckets * window to window seconds of the
+    original.
+    """
+
+    def __init__(self, window: float = 10.0, buckets: int = 10, clock=time.monotonic):
+        self.slot = window / buckets
+        self._clock = clock
+        self._sets: List[set] = [set() for _ in range(buckets)]
+        self._epochs = [-1] * buckets
+        self._lock = threading.Lock()
+        self.admitted = 0
+        self.suppressed = 0
+
+    def admit(self, recipient: Optional[str], message: str) -> bool:
+        key = hash((recipient, message))
+        epoch = int(self._clock() / self.slot)
+        buckets = len(self._sets)
+        oldest = epoch - buckets
+        with self._lock:
+            index = epoch % buckets
+            if self._epochs[index] != epoch:
+                self._sets[index] = set()
+                self._epochs[index] = epoch
+            for bucket_epoch, keys in zip(self._epochs, self._sets):
+                if bucket_epoch > oldest and key in keys:
+                    self.suppressed += 1
+                    return False
+            self._sets[index].add(key)
+            self.admitted += 1
+            return True
+
+    def __len__(self) -> int:
+        return sum(len(keys) for keys in self._sets)
+
+
+def benchmark_dedup(events: int = 2_000_000, recipients: int = 500_000, tick: float = 1e-5):
+    # a fake clock advances `tick` per event; with the defaults a 10 s window
+    # spans 1M events and every recipient's update is re-triggered every 500k
+    now = [0.0]
+    dedup = DedupWindow(window=10.0, clock=lambda: now[0])
+    app = NotificationApp(_NullSMSFactory(), dedup=dedup)
+    start = time.perf_counter()
+    peak = 0
+    for i in range(events):
+        now[0] += tick
+        app.notify("Your order is shipped", recipient=f"user{(i * 7919) % recipients}")
+        if i % 10_000 == 0:
+            peak = max(peak, len(dedup))
+    elapsed = time.perf_counter() - start
+    print(f"{events} notify calls: sent {dedup.admitted}, suppressed {dedup.suppressed},"
+          f" peak keys held {peak}, {elapsed / events * 1e9:.0f} ns/call")
+
+
+# ============================================================
+# 12. PROCESS POOL
+# ============================================================
+
+class SharedRingBuffer:
+    """
+    Single-producer / single-consumer ring of fixed-size slots in
+    multiprocessing.shared_memory.
+
+    Each slot holds one frame: <I> count, <I> byte lengths for
+    (recipient, message) of every entry, then the utf-8 bytes. Two
+    semaphores count free and filled slots; they also order the slot
+    writes and reads between the processes, so no head/tail counters
+    are shared. An empty frame tells the consumer to stop.
+
+    put() and stop() take an optional `alive` callable: while the ring is
+    full they poll it and raise RuntimeError once the consumer is gone,
+    instead of waiting for a slot that will never be freed.
+    """
+
+    _COUNT = struct.Struct("<I")
+    _POLL = 0.1
+
+    def __init__(self, slots: int = 64, slot_size: int = 256 * 1024, context=None):
+        context = context or multiprocessing.get_context()
+        self.slots = slots
+        self.slot_size = slot_size
+        self._memory = shared_memory.SharedMemory(create=True, size=slots * slot_size)
+        self._free = context.Semaphore(slots)
+        self._filled = context.Semaphore(0)
+        self._position = 0  # next slot for this side (producer or consumer)
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        state["_memory"] = self._memory.name
+        return state
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        # child processes share the parent's resource tracker, so attaching
+        # here does not make the block outlive (or die with) this process
+        self._memory = shared_memory.SharedMemory(name=state["_memory"])
+
+    def pack(self, entries: List[Tuple[Optional[str], str]]) -> List[bytes]:
+        # splits (recipient, message) entries into frames that fit one slot
+        frames, lengths, chunks, size = [], array("I"), [], self._COUNT.size
+        for recipient, message in entries:
+            recipient_bytes = (recipient or "").encode()
+            message_bytes = message.encode()
+            entry_size = 8 + len(recipient_bytes) + len(message_bytes)
+            if entry_size + self._COUNT.size > self.slot_size:
+                raise ValueError("Message larger than a ring slot")
+            if size + entry_size > self.slot_size:
+                frames.append(self._frame(lengths, chunks))
+                lengths, chunks, size = array("I"), [], self._COUNT.size
+            lengths.append(len(recipient_bytes))
+            lengths.append(len(message_bytes))
+            chunks.append(recipient_bytes)
+            chunks.append(message_bytes)
+            size += entry_size
+        if chunks:
+            frames.append(self._frame(lengths, chunks))
+        return frames
+
+    def _frame(self, lengths: array, chunks: List[bytes]) -> bytes:
+        return self._COUNT.pack(len(lengths) // 2) + lengths.tobytes() + b"".join(chunks)
+
+    def put(self, frame: bytes, alive=None):
+        while not self._free.acquire(timeout=self._POLL):
+            if alive is not None and not alive():
+                raise RuntimeError("Ring consumer exited")
+        offset = (self._position % self.slots) * self.slot_size
+        self._memory.buf[offset:offset + len(frame)] = frame
+        self._position += 1
+        self._filled.release()
+
+    def get(self) -> Optional[List[Tuple[Optional[str], str]]]:
+        self._filled.acquire()
+        offset = (self._position % self.slots) * self.slot_size
+        buf = self._memory.buf
+        (count,) = self._COUNT.unpack_from(buf, offset)
+        if count == 0:
+            self._position += 1
+            self._free.release()
+            return None
+        offset += self._COUNT.size
+        lengths = array("I")
+        lengths.frombytes(buf[offset:offset + 8 * count])
+        offset += 8 * count
+        strings = []
+        for length in lengths:
+            strings.append(bytes(buf[offset:offset + length]).decode())
+            offset += length
+        self._position += 1
+        self._free.release()
+        return [(recipient or None, message) for recipient, message in zip(strings[::2], strings[1::2])]
+
+    def stop(self, alive=None):
+        self.put(self._COUNT.pack(0), alive)
+
+    def close(self):
+        self._memory.close()
+
+    def unlink(self):
+        self._memory.unlink()
+
+
+def _notification_worker(factory_bytes: bytes, ring: SharedRingBuffer, processed, failed):
+    # every worker rebuilds the factory (and so its products) from the pickle
+    factory = pickle.loads(factory_bytes)
+    app = NotificationApp(factory)
+    while True:
+        entries = ring.get()
+        if entries is None:
+            break
+        # a batch that fails to format or send is counted, and the worker
+        # keeps draining the ring so the parent never waits on a dead consumer
+        try:
+            if all(recipient is None for recipient, _ in entries):
+                app.notify_many([message for _, message in entries])
+            else:
+                for recipient, message in entries:
+                    app.notify(message, recipient=recipient)
+        except Exception:
+            failed.value += len(entries)
+        else:
+            processed.value += len(entries)
+    try:
+        app.flush()
+    except Exception:
+        pass
+    ring.close()
+
+
+class ProcessNotificationPool:
+    """
+    Formats and sends in `processes` worker processes, one ring buffer
+    per worker. The factory is pickled once and rebuilt in every worker;
+    batches are spread over the rings round-robin. Batches whose format
+    or send raised are counted in `failed`; if a worker process dies,
+    submit() and close() raise RuntimeError instead of blocking.
+    """
+
+    def __init__(self, factory: NotificationFactory, processes: int = 4, slots: int = 64,
+                 slot_size: int = 256 * 1024, context=None):
+        context = context or multiprocessing.get_context()
+        factory_bytes = pickle.dumps(factory)
+        self._rings = [SharedRingBuffer(slots, slot_size, context) for _ in range(processes)]
+        self._processed = [context.Value("q", 0, lock=False) for _ in range(processes)]
+        self._failed = [context.Value("q", 0, lock=False) for _ in range(processes)]
+        self._workers = [
+            context.Process(target=_notification_worker, args=(factory_bytes, ring, processed, failed),
+                            name=f"notification-worker-{i}", daemon=True)
+            for i, (ring, processed, failed) in enumerate(zip(self._rings, self._processed, self._failed))
+        ]
+        for worker in self._workers:
+            worker.start()
+        self._next = 0
+        self.closed = False
+
+    @property
+    def failed(self) -> int:
+        # messages in batches that raised in a worker
+        return sum(failed.value for failed in self._failed)
+
+    def submit(self, entries: List[Tuple[Optional[str], str]]):
+        rings = self._rings
+        for frame in rings[0].pack(entries):
+            worker = self._workers[self._next]
+            try:
+                rings[self._next].put(frame, worker.is_alive)
+            except RuntimeError:
+                raise RuntimeError(f"{worker.name} exited with code {worker.exitcode}") from None
+            self._next = (self._next + 1) % len(rings)
+
+    def close(self) -> int:
+        # drains the rings, stops the workers and returns how many were processed
+        if not self.closed:
+            self.closed = True
+            dead = []
+            try:
+                for ring, worker in zip(self._rings, self._workers):
+                    try:
+                        ring.stop(worker.is_alive)
+                    except RuntimeError:
+                        dead.append(worker)
+                for worker in self._workers:
+                    worker.join()
+            finally:
+                for ring in self._rings:
+                    ring.close()
+                    ring.unlink()
+            if dead:
+                raise RuntimeError(", ".join(f"{worker.name} exited with code {worker.exitcode}"
+                                             for worker in dead))
+        return sum(processed.value for processed in self._processed)
+
+    def __enter__(self) -> "ProcessNotificationPool":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class _SigningFormatter(TemplateMessageFormatter):
+    # stands in for real template work plus message signing
+    def __init__(self, rounds: int = 50):
+        super().__init__("[SMS FORMAT] {message}", cache=False)
+        self.rounds = rounds
+
+    def format_message(self, message: str) -> str:
+        signature = message.encode()
+        for _ in range(self.rounds):
+            signature = hmac.new(b"notification-key", signature, hashlib.sha256).digest()
+        return f"{super().format_message(message)} sig={signature.hex()[:16]}"
+
+
+class _SigningNullSMSFactory(_NullSMSFactory):
+    def create_formatter(self) -> MessageFormatter:
+        return _SigningFormatter()
+
+
+def benchmark_process_pool(messages: int = 50_000, process_counts=(1, 2, 4, 8)):
+    batch = [f"Your OTP is {i:06d}" for i in range(messages)]
+    start = time.perf_counter()
+    NotificationApp(_SigningNullSMSFactory()).notify_many(batch)
+    inline = time.perf_counter() - start
+    print(f"in-process : {messages / inline:9.0f} msg/s")
+    for processes in process_counts:
+        start = time.perf_counter()
+        app = NotificationApp(_SigningNullSMSFactory(), processes=processes)
+        app.notify_many(batch)
+        processed = app.close()
+        elapsed = time.perf_counter() - start
+        assert processed == messages
+        print(f"{processes} process(es): {messages / elapsed:9.0f} msg/s")
+
+
+# ============================================================
+# 13. OUTBOX
+# ============================================================
+
+class NotificationOutbox:
+    """
+    Durable outbox in SQLite (WAL mode).
+
+    notify() only appends a row; a dispatcher later claims a batch, sends
+    it and acks (deletes) it. Each enqueue_many / claim / ack is one
+    transaction, so the sync cost is paid per batch. Rows that were
+    claimed but never acked belong to a process that died: opening the
+    outbox makes them pending again, so they are replayed.
+
+    synchronous="NORMAL" survives a process crash; use "FULL" to also
+    survive power loss (one fsync per transaction).
+    """
+
+    def __init__(self, path: str, synchronous: str = "NORMAL"):
+        self.path = path
+        self._db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(f"PRAGMA synchronous={synchronous}")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY,
+                channel TEXT NOT NULL,
+                recipient TEXT,
+                message TEXT NOT NULL,
+                claimed INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS outbox_pending ON outbox (channel, id) WHERE claimed = 0;
+            CREATE INDEX IF NOT EXISTS outbox_claimed ON outbox (id) WHERE claimed = 1;
+        """)
+        with self._lock:
+            self.recovered = self._db.execute(
+                "UPDATE outbox SET claimed = 0 WHERE claimed = 1").rowcount
+
+    def enqueue(self, channel: str, message: str, recipient: Optional[str] = None):
+        with self._lock:
+            self._db.execute("INSERT INTO outbox (channel, recipient, message) VALUES (?, ?, ?)",
+                             (channel, recipient, message))
+
+    def enqueue_many(self, channel: str, messages: List[str], recipient: Optional[str] = None):
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                self._db.executemany(
+                    "INSERT INTO outbox (channel, recipient, message) VALUES (?, ?, ?)",
+                    ((channel, recipient, message) for message in messages))
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+
+    def claim(self, channel: str, limit: int = 500) -> List[Tuple[int, Optional[str], str]]:
+        # (id, recipient, message) of the oldest pending rows, now claimed
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._db.execute(
+                    "SELECT id, recipient, message FROM outbox"
+                    " WHERE claimed = 0 AND channel = ? ORDER BY id LIMIT ?",
+                    (channel, limit)).fetchall()
+                self._db.executemany("UPDATE outbox SET claimed = 1 WHERE id = ?",
+                                     ((row[0],) for row in rows))
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+        return rows
+
+    def _update(self, statement: str, ids: List[int]):
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                self._db.executemany(statement, ((row_id,) for row_id in ids))
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+
+    def ack(self, ids: List[int]):
+        self._update("DELETE FROM outbox WHERE id = ?", ids)
+
+    def release(self, ids: List[int]):
+        # gives claimed rows back, e.g. after a failed send
+        self._update("UPDATE outbox SET claimed = 0 WHERE id = ?", ids)
+
+    def pending(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM outbox WHERE claimed = 0").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def benchmark_outbox(rows: int = 10_000_000, batch: int = 10_000, in_flight: int = 50_000):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "outbox.db")
+        outbox = NotificationOutbox(path)
+        messages = [f"Your order #{i} is shipped" for i in range(batch)]
+        start = time.perf_counter()
+        for _ in range(rows // batch):
+            outbox.enqueue_many("sms", messages)
+        elapsed = time.perf_counter() - start
+        print(f"enqueue: {rows / elapsed:10.0f} rows/s ({rows} rows in batches of {batch})")
+
+        # claim without acking, then "crash" by dropping the connection
+        for _ in range(in_flight // 500):
+            outbox.claim("sms", 500)
+        outbox.close()
+
+        start = time.perf_counter()
+        outbox = NotificationOutbox(path)
+        recovery = time.perf_counter() - start
+        print(f"recovery: {recovery * 1e3:8.1f} ms to reopen {rows} rows"
+              f" and return {outbox.recovered} unacked rows to pending")
+        outbox.close()
+
+
+# ============================================================
+# 14. REGISTRY STARTUP
+# ============================================================
+
+def _write_families(directory: str, count: int):
+    # `count` channel modules with one factory each, plus two startup
+    # modules: one registers every family by import path, the other
+    # imports every family module and registers the classes
+    lazy = ["from abstract_factory import notification_registry"]
+    eager = ["from abstract_factory import notification_registry"]
+    for i in range(count):
+        with open(os.path.join(directory, f"family{i}.py"), "w") as file:
+            file.write("from notification_channels import PushNotificationFactory\n\n\n"
+                       f"class Family{i}NotificationFactory(PushNotificationFactory):\n"
+                       f"    channel = 'family{i}'\n")
+        lazy.append(f"notification_registry.register('family{i}', 'family{i}:Family{i}NotificationFactory')")
+        eager.append(f"from family{i} import Family{i}NotificationFactory")
+        eager.append(f"notification_registry.register('family{i}', Family{i}NotificationFactory)")
+    for name, lines in (("startup_lazy", lazy), ("startup_eager", eager)):
+        with open(os.path.join(directory, f"{name}.py"), "w") as file:
+            file.write("\n".join(lines) + "\n")
+
+
+def benchmark_registry_startup(sizes=(3, 30, 300, 3000)):
+    # import time of a fresh interpreter with `size` families registered by
+    # import path (nothing imported until first use) vs. imported up front
+    script = (
+        "import sys, time\n"
+        "start = time.perf_counter()\n"
+        "import {module}\n"
+        "imported = time.perf_counter() - start\n"
+        "from abstract_factory import notification_registry\n"
+        "start = time.perf_counter()\n"
+        "notification_registry.get('family{last}')\n"
+        "first = time.perf_counter() - start\n"
+        "print(f'{{imported * 1e3:.1f}} {{first * 1e3:.2f}}')\n"
+    )
+    here = os.path.dirname(os.path.abspath(__file__))
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            _write_families(directory, size)
+            env = dict(os.environ, PYTHONPATH=os.pathsep.join([directory, here]))
+            results = {}
+            for module in ("startup_lazy", "startup_eager"):
+                command = [sys.executable, "-c", script.format(module=module, last=size - 1)]
+                # the first run writes the bytecode caches; time the second
+                subprocess.run(command, cwd=directory, env=env, capture_output=True, check=True)
+                results[module] = subprocess.run(command, cwd=directory, env=env, capture_output=True,
+                                                 text=True, check=True).stdout.split()
+        (lazy, lazy_first), (eager, _) = results["startup_lazy"], results["startup_eager"]
+        print(f"{size:>5} families | startup by import path: {lazy:>7} ms"
+              f" (first get_factory {lazy_first} ms) | all imported up front: {eager:>7} ms")
+
+
+# ============================================================
+# 15. DIGESTS
+# ============================================================
+
+class TimerWheel:
+    """
+    Hashed timer wheel: `slots` buckets of `tick` seconds each.
+
+    schedule() drops a key into the bucket its deadline falls in; advance()
+    walks only the buckets passed since the last call and returns the keys
+    that are due. Deadlines further out than one turn of the wheel stay in
+    their bucket until the turn they belong to.
+    """
+
+    def __init__(self, tick: float = 1.0, slots: int = 512):
+        self.tick = tick
+        self._slots: List[List[Tuple[int, object]]] = [[] for _ in range(slots)]
+        self._current = None
+
+    def schedule(self, key, deadline: float):
+        deadline_tick = int(deadline / self.tick)
+        if self._current is not None and deadline_tick <= self._current:
+            deadline_tick = self._current + 1
+        self._slots[deadline_tick % len(self._slots)].append((deadline_tick, key))
+
+    def advance(self, now: float) -> List[object]:
+        now_tick = int(now / self.tick)
+        slots = len(self._slots)
+        due = []
+        # one full turn visits every bucket, so there is no point going further;
+        # the first call has no previous tick, so it scans the whole turn
+        # up to and including now_tick
+        if self._current is None:
+            start = now_tick - slots + 1
+            self._current = now_tick
+        else:
+            start = max(self._current + 1, now_tick - slots + 1)
+        for tick in range(start, now_tick + 1):
+            bucket = self._slots[tick % slots]
+            if bucket:
+                keep = [entry for entry in bucket if entry[0] > now_tick]
+                if len(keep) != len(bucket):
+                    due.extend(key for deadline_tick, key in bucket if deadline_tick <= now_tick)
+                    self._slots[tick % slots] = keep
+        self._current = max(self._current, now_tick)
+        return due
+
+
+class NotificationDigest:
+    """
+    Holds messages per recipient for `window` seconds after the first one
+    arrives, then releases them together so they go out as one send.
+
+    Window ends are tracked on a TimerWheel, so checking for due digests
+    costs the same with ten recipients waiting or a million. A
+    NotificationApp in digest mode checks every `tick` seconds.
+    """
+
+    def __init__(self, window: float = 3600.0, tick: float = 1.0, slots: int = 512,
+                 clock=time.monotonic):
+        self.window = window
+        self.tick = tick
+        self._clock = clock
+        self._wheel = TimerWheel(tick, slots)
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def add(self, recipient: Optional[str], message: str):
+        with self._lock:
+            messages = self._pending.get(recipient)
+            if messages is None:
+                self._pending[recipient] = [message]
+                self._wheel.schedule(recipient, self._clock() + self.window)
+            else:
+                messages.append(message)
+
+    def requeue(self, recipient: Optional[str], messages: List[str]):
+        # puts back a batch that could not be sent; it is due again next tick,
+        # ahead of anything that arrived for the recipient in the meantime
+        with self._lock:
+            pending = self._pending.get(recipient)
+            if pending is None:
+                self._pending[recipient] = list(messages)
+                self._wheel.schedule(recipient, self._clock() + self.tick)
+            else:
+                pending[:0] = messages
+
+    def due(self) -> List[Tuple[Optional[str], List[str]]]:
+        # (recipient, messages) for every window that has closed
+        with self._lock:
+            pop = self._pending.pop
+            return [(recipient, pop(recipient))
+                    for recipient in self._wheel.advance(self._clock())]
+
+    def drain(self) -> List[Tuple[Optional[str], List[str]]]:
+        # everything still held, whether its window has closed or not
+        with self._lock:
+            self._wheel = TimerWheel(self._wheel.tick, len(self._wheel._slots))
+            pending, self._pending = self._pending, {}
+            return list(pending.items())
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+
+class _CountingSender(MessageSender):
+    def __init__(self):
+        self.calls = 0
+
+    def send_message(self, message: str, recipient: Optional[str] = None):
+        self.calls += 1
+
+
+class _CountingSMSFactory(SMSNotificationFactory):
+    def create_sender(self) -> MessageSender:
+        return _CountingSender()
+
+
+def benchmark_digest(events: int = 1_000_000, recipients: int = 10_000, tick: float = 0.01):
+    # a fake clock advances `tick` per event: 1M events span ~2.8 hours
+    for label, window in (("no digest", None), ("15 min digest", 900.0), ("1 h digest", 3600.0)):
+        now = [0.0]
+        digest = None
+        if window is not None:
+            digest = NotificationDigest(window, clock=lambda: now[0])
+        app = NotificationApp(_CountingSMSFactory(), digest=digest)
+        start = time.perf_counter()
+        for i in range(events):
+            now[0] += tick
+            app.notify(f"Update #{i}", recipient=f"user{(i * 7919) % recipients}")
+        app.close()
+        elapsed = time.perf_counter() - start
+        print(f"{label:<14}: {events} notify calls -> {app.sender.calls:>8} sends,"
+              f" {elapsed / events * 1e9:5.0f} ns/call")
+
+
+# ============================================================
+# 16. RESILIENCE
+# ============================================================
+
+class LatencyHistogram:
+    """
+    Fixed-memory latency histogram in the style of HdrHistogram.
+
+    Values are counted in units of `resolution` seconds in log2 buckets,
+    each split into 2**sub_bucket_bits linear sub-buckets, so every value
+    keeps about 1 / 2**sub_bucket_bits relative precision (3% by default)
+    and memory does not grow with the number of samples. Values above
+    `max_seconds` are counted in the top bucket.
+
+    Each thread records into its own counters, so record() takes no lock;
+    readers merge the per-thread counters. When a thread exits its
+    counters (and what they counted) are handed to the next new thread,
+    so there are never more of them than threads recording at once.
+    """
+
+    def __init__(self, max_seconds: float = 60.0, sub_bucket_bits: int = 5,
+                 resolution: float = 1e-6):
+        self._sub = 1 << sub_bucket_bits
+        self._sub_bits = sub_bucket_bits
+        self._linear = 2 * self._sub
+        self._scale = 1 / resolution
+        self.resolution = resolution
+        self._max = int(max_seconds * self._scale)
+        self._size = self._index(self._max) + 1
+        self._local = threading.local()
+        self._shards: List[Tuple[list, list]] = []
+        self._free: List[Tuple[list, list]] = []
+        self._lock = threading.Lock()
+
+    def _index(self, value: int) -> int:
+        if value < self._linear:
+            return value
+        shift = value.bit_length() - self._sub_bits - 1
+        return shift * self._sub + (value >> shift)
+
+    def _value(self, index: int) -> int:
+        # lowest value counted in bucket `index`
+        if index < self._linear:
+            return index
+        shift = index // self._sub - 1
+        return (index - shift * self._sub) << shift
+
+    def _shard(self) -> Tuple[list, list]:
+        with self._lock:
+            if self._free:
+                shard = self._free.pop()
+            else:
+                shard = ([0] * self._size, [0.0])
+                self._shards.append(shard)
+        self._local.shard = shard
+        self._local.lease = _ShardLease(shard, self._free)
+        return shard
+
+    def record(self, seconds: float, count: int = 1):
+        value = int(seconds * self._scale)
+        if value >= self._linear:
+            if value > self._max:
+                value = self._max
+            shift = value.bit_length() - self._sub_bits - 1
+            value = shift * self._sub + (value >> shift)
+        elif value < 0:
+            value = 0
+        try:
+            counts, total = self._local.shard
+        except AttributeError:
+            counts, total = self._shard()
+        counts[value] += count
+        total[0] += seconds * count
+
+    def _merged(self) -> List[int]:
+        with self._lock:
+            shards = list(self._shards)
+        return [sum(column) for column in zip(*(counts for counts, _ in shards))]
+
+    @property
+    def count(self) -> int:
+        return sum(self._merged())
+
+    def percentile(self, percentile: float) -> float:
+        # in seconds; the lower bound of the bucket holding that rank
+        counts = self._merged()
+        samples = sum(counts)
+        if not samples:
+            return 0.0
+        rank = max(1, -(-samples * percentile // 100))
+        seen = 0
+        for index, count in enumerate(counts):
+            seen += count
+            if seen >= rank:
+                return self._value(index) * self.resolution
+        return self._max * self.resolution
+
+    def mean(self) -> float:
+        with self._lock:
+            total = sum(shard_total[0] for _, shard_total in self._shards)
+        count = self.count
+        return total / count if count else 0.0
+
+    def reset(self):
+        with self._lock:
+            for counts, total in self._shards:
+                counts[:] = [0] * self._size
+                total[0] = 0.0
+
+
+class _ShardLease:
+    # lives in the owning thread's threading.local, which is cleared when
+    # the thread exits; the shard then goes back on the histogram's free list
+    __slots__ = ("shard", "free")
+
+    def __init__(self, shard: Tuple[list, list], free: list):
+        self.shard = shard
+        self.free = free
+
+    def __del__(self):
+        self.free.append(self.shard)
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and then rejects
+    calls without trying them for `reset_timeout` seconds. After that one
+    trial call is let through (half-open): success closes the breaker,
+    failure opens it again.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and self._clock() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = self._clock()
+
+
+class ResilientSender(MessageSender):
+    """
+    Wraps a provider's sender with its circuit breaker and retries with
+    exponential backoff and full jitter. When the primary gives up (or its
+    breaker is open) the message goes to the fallback sender, if any.
+
+    With `hedge_after` set, the primary send runs on the factory's hedge
+    executor; if it has not finished after that many seconds the message
+    is also sent through the fallback on the calling thread, so primaries
+    stuck on a hung provider (and filling the executor) never delay it. A
+    slow provider costs at most `hedge_after` plus the fallback's latency.
+    A hedged message may be delivered twice.
+    """
+
+    def __init__(self, sender: MessageSender, fallback: Optional[MessageSender],
+                 policy: "ResilientNotificationFactory"):
+        self.sender = sender
+        self.fallback = fallback
+        self.policy = policy
+        self.fallbacks = 0
+
+    def _call(self, send, histogram: LatencyHistogram, message: str, recipient: Optional[str]):
+        start = time.perf_counter()
+        try:
+            send(message, recipient)
+        finally:
+            histogram.record(time.perf_counter() - start)
+
+    def _primary(self, message: str, recipient: Optional[str]):
+        policy = self.policy
+        breaker = policy.breaker
+        error: Exception = CircuitOpenError(f"{policy.channel} circuit is open")
+        for attempt in range(policy.retries + 1):
+            if attempt:
+                time.sleep(random.uniform(0, min(policy.max_delay, policy.base_delay * 2 ** (attempt - 1))))
+            if not breaker.allow():
+                break
+            try:
+                self._call(self.sender.send_message, policy.latency, message, recipient)
+            except Exception as exc:
+                breaker.record_failure()
+                error = exc
+            else:
+                breaker.record_success()
+                return
+        raise error
+
+    def _secondary(self, message: str, recipient: Optional[str]):
+        self.fallbacks += 1
+        self._call(self.fallback.send_message, self.policy.fallback_latency, message, recipient)
+
+    def send_message(self, message: str, recipient: Optional[str] = None):
+        if self.policy.hedge_after is None or self.fallback is None:
+            try:
+                self._primary(message, recipient)
+            except Exception:
+                if self.fallback is None:
+                    raise
+                self._secondary(message, recipient)
+            return
+
+        executor = self.policy.executor()
+        primary = executor.submit(self._primary, message, recipient)
+        done, _ = futures.wait([primary], timeout=self.policy.hedge_after)
+        if done and primary.exception() is None:
+            return
+        try:
+            self._secondary(message, recipient)
+        except Exception:
+            # the primary can still succeed; wait for it
+            if primary.exception() is None:
+                return
+            raise
+        # a primary still queued behind stuck ones is not sent at all
+        primary.cancel()
+
+    def flush(self):
+        self.sender.flush()
+        if self.fallback is not None:
+            self.fallback.flush()
+
+
+class ResilientNotificationFactory(NotificationFactory):
+    """
+    Wraps any NotificationFactory. Every sender it creates shares one
+    circuit breaker and latency histogram for the provider, and sends
+    that fail (or, with `hedge_after`, are slow) are retried on the
+    `fallback` family, e.g. email behind SMS.
+    """
+
+    def __init__(self, factory: NotificationFactory,
+                 fallback: Optional[NotificationFactory] = None,
+                 retries: int = 2, base_delay: float = 0.05, max_delay: float = 1.0,
+                 failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 hedge_after: Optional[float] = None, hedge_workers: int = 32):
+        self._args = (factory, fallback, retries, base_delay, max_delay,
+                      failure_threshold, reset_timeout, hedge_after, hedge_workers)
+        self.factory = factory
+        self.fallback = fallback
+        self.channel = factory.channel
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge_after = hedge_after
+        self.hedge_workers = hedge_workers
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.latency = LatencyHistogram()
+        self.fallback_latency = LatencyHistogram()
+        self._executor: Optional[futures.ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def __reduce__(self):
+        # breaker, histograms and threads are rebuilt per process
+        return type(self), self._args
+
+    def executor(self) -> futures.ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = futures.ThreadPoolExecutor(
+                        self.hedge_workers, thread_name_prefix=f"{self.channel}-hedge")
+        return self._executor
+
+    def create_sender(self) -> MessageSender:
+        fallback = self.fallback.create_sender() if self.fallback is not None else None
+        return ResilientSender(self.factory.create_sender(), fallback, self)
+
+    def create_formatter(self) -> MessageFormatter:
+        return self.factory.create_formatter()
+
+
+class _FlakySender(MessageSender):
+    # a provider that takes `latency` seconds, `slow_latency` for a
+    # `slow_rate` share of calls, and fails a `failure_rate` share
+    def __init__(self, latency: float, slow_latency: float = 0.0, slow_rate: float = 0.0,
+                 failure_rate: float = 0.0):
+        self.latency = latency
+        self.slow_latency = slow_latency
+        self.slow_rate = slow_rate
+        self.failure_rate = failure_rate
+
+    def send_message(self, message: str, recipient: Optional[str] = None):
+        slow = random.random() < self.slow_rate
+        time.sleep(self.slow_latency if slow else self.latency)
+        if random.random() < self.failure_rate:
+            raise ConnectionError("provider error")
+
+
+class _FlakyFactory(NotificationFactory):
+    def __init__(self, channel: str, **behaviour):
+        self.channel = channel
+        self.behaviour = behaviour
+
+    def create_sender(self) -> MessageSender:
+        return _FlakySender(**self.behaviour)
+
+    def create_formatter(self) -> MessageFormatter:
+        return SMSMessageFormatter()
+
+
+def benchmark_resilience(sends: int = 1_000):
+    # SMS: 1 ms, but 3% of calls take 200 ms and 5% fail; email fallback: 2 ms
+    def sms():
+        return _FlakyFactory("sms", latency=0.001, slow_latency=0.2, slow_rate=0.03, failure_rate=0.05)
+
+    email = _FlakyFactory("email", latency=0.002)
+    cases = [
+        ("bare sender", None),
+        ("retries", ResilientNotificationFactory(sms(), retries=2, base_delay=0.001)),
+        ("retries + email", ResilientNotificationFactory(sms(), email, retries=2, base_delay=0.001)),
+        ("hedged at 10 ms", ResilientNotificationFactory(sms(), email, retries=2, base_delay=0.001,
+                                                         hedge_after=0.01)),
+    ]
+    for label, factory in cases:
+        sender = (factory or sms()).create_sender()
+        histogram = LatencyHistogram()
+        failed = 0
+        for i in range(sends):
+            start = time.perf_counter()
+            try:
+                sender.send_message(f"Your OTP is {i:06d}", "+910000000000")
+            except Exception:
+                failed += 1
+            histogram.record(time.perf_counter() - start)
+        print(f"{label:<16}: p50 {histogram.percentile(50) * 1e3:6.1f} ms,"
+              f" p99 {histogram.percentile(99) * 1e3:6.1f} ms, failed {failed}/{sends}"
+              f", fallback sends {getattr(sender, 'fallbacks', 0)}")
+
+    # provider down: the breaker stops paying the 50 ms timeout on every call
+    for threshold in (10**9, 5):
+        down = _FlakyFactory("sms", latency=0.05, failure_rate=1.0)
+        factory = ResilientNotificationFactory(down, email, retries=0, failure_threshold=threshold)
+        sender = factory.create_sender()
+        start = time.perf_counter()
+        for i in range(200):
+            sender.send_message(f"Your OTP is {i:06d}", "+910000000000")
+        elapsed = time.perf_counter() - start
+        label = "breaker" if threshold == 5 else "no breaker"
+        print(f"provider down, {label:<10}: {elapsed / 200 * 1e3:5.1f} ms/send,"
+              f" rejected by breaker {factory.breaker.rejected}")
+
+
+# ============================================================
+# 17. INSTRUMENTATION
+# ============================================================
+
+class NotificationMetrics:
+    """
+    Format and send latency per channel, plus optional tracing spans.
+
+    Pass one to NotificationApp(metrics=...) and the app's formatter and
+    sender are wrapped in timing proxies; without it nothing is wrapped,
+    so instrumentation that is off costs nothing. A plain inline notify()
+    skips the proxies: one wrapper times both stages around the bare
+    formatter and sender (with a tracer, under a single notification.notify
+    span). Batch calls record their per-message average. `tracer` is any OpenTelemetry-compatible
+    tracer (an object with start_as_current_span), for example
+    opentelemetry.trace.get_tracer("notifications").
+    """
+
+    def __init__(self, tracer=None):
+        self.tracer = tracer
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, channel: str, stage: str) -> LatencyHistogram:
+        key = (channel, stage)
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key, LatencyHistogram(resolution=1e-8))
+        return histogram
+
+    def summary(self) -> dict:
+        # {(channel, stage): (count, p50, p99, p99.9)} in seconds, 10 ns resolution
+        return {key: (histogram.count, histogram.percentile(50), histogram.percentile(99),
+                      histogram.percentile(99.9))
+                for key, histogram in sorted(self._histograms.items())}
+
+
+class _Instrumented:
+    def __init__(self, inner, metrics: NotificationMetrics, channel: str, stage: str):
+        self.inner = inner
+        self._record = metrics.histogram(channel, stage).record
+        self._tracer = metrics.tracer
+        self._span_name = f"notification.{stage}"
+        self._channel = channel
+
+    def _span(self, count: int):
+        if self._tracer is None:
+            return contextlib.nullcontext()
+        return self._tracer.start_as_current_span(self._span_name, attributes={
+            "notification.channel": self._channel,
+            "messaging.batch.message_count": count})
+
+    def _timed_batch(self, call, items: list):
+        with self._span(len(items)):
+            start = time.perf_counter()
+            result = call(items)
+            elapsed = time.perf_counter() - start
+        if items:
+            self._record(elapsed / len(items), len(items))
+        return result
+
+
+class _InstrumentedFormatter(_Instrumented, MessageFormatter):
+    def format_message(self, message: str) -> str:
+        # the per-message paths are spelled out: they run on every notify
+        if self._tracer is None:
+            start = time.perf_counter()
+            formatted = self.inner.format_message(message)
+            self._record(time.perf_counter() - start)
+            return formatted
+        with self._span(1):
+            start = time.perf_counter()
+            formatted = self.inner.format_message(message)
+            self._record(time.perf_counter() - start)
+        return formatted
+
+    def format_many(self, messages: List[str]) -> List[str]:
+        return self._timed_batch(self.inner.format_many, messages)
+
+    def format_digest(self, messages: List[str]) -> str:
+        with self._span(1):
+            start = time.perf_counter()
+            formatted = self.inner.format_digest(messages)
+            self._record(time.perf_counter() - start)
+        return formatted
+
+
+class _InstrumentedSender(_Instrumented, MessageSender):
+    def send_message(self, message: str, recipient: Optional[str] = None):
+        if self._tracer is None:
+            start = time.perf_counter()
+            self.inner.send_message(message, recipient)
+            self._record(time.perf_counter() - start)
+            return
+        with self._span(1):
+            start = time.perf_counter()
+            self.inner.send_message(message, recipient)
+            self._record(time.perf_counter() - start)
+
+    def send_batch(self, messages: List[str]):
+        self._timed_batch(self.inner.send_batch, messages)
+
+    def flush(self):
+        self.inner.flush()
+
+
+def _timed_notify(formatter: MessageFormatter, sender: MessageSender,
+                  metrics: NotificationMetrics, channel: str):
+    # format + send with three clock reads and no proxy calls in between
+    format_message, send_message = formatter.format_message, sender.send_message
+    record_format = metrics.histogram(channel, "format").record
+    record_send = metrics.histogram(channel, "send").record
+    tracer, clock = metrics.tracer, time.perf_counter
+
+    def notify(message: str, recipient: Optional[str]):
+        start = clock()
+        formatted = format_message(message)
+        formatted_at = clock()
+        send_message(formatted, recipient)
+        end = clock()
+        record_format(formatted_at - start)
+        record_send(end - formatted_at)
+
+    if tracer is None:
+        return notify
+
+    def traced_notify(message: str, recipient: Optional[str]):
+        with tracer.start_as_current_span("notification.notify", attributes={
+                "notification.channel": channel, "messaging.batch.message_count": 1}):
+            notify(message, recipient)
+
+    return traced_notify
+
+
+class _NullSpanTracer:
+    # cheapest possible OpenTelemetry-shaped tracer, for measuring hook cost
+    def start_as_current_span(self, name: str, attributes=None):
+        return contextlib.nullcontext()
+
+
+def benchmark_instrumentation(calls: int = 1_000_000):
+    cases = [("off", None), ("histograms", NotificationMetrics()),
+             ("histograms + spans", NotificationMetrics(_NullSpanTracer()))]
+    baseline = None
+    for label, metrics in cases:
+        app = NotificationApp(_NullSMSFactory(), metrics=metrics)
+        notify = app.notify
+        start = time.perf_counter()
+        for i in range(calls):
+            notify("Your OTP is 123456")
+        per_call = (time.perf_counter() - start) / calls * 1e9
+        baseline = baseline or per_call
+        print(f"{label:<19}: {per_call:5.0f} ns/notify (+{per_call - baseline:4.0f} ns)")
+    for (channel, stage), (count, p50, p99, p999) in metrics.summary().items():
+        print(f"  {channel}/{stage}: {count} samples, p50 {p50 * 1e9:.0f} ns,"
+              f" p99 {p99 * 1e9:.0f} ns, p99.9 {p999 * 1e9:.0f} ns")
 
 
 # ============================================================
-# 8. MAIN (USAGE)
+# 18. MAIN (USAGE)
 # ============================================================
 
 if __name__ == "__main__":
@@ -141,6 +2559,26 @@ if __name__ == "__main__":
     app = NotificationApp(factory)
     app.notify("Your OTP is 123456")
 
+    app.notify_many([f"Your order #{order_id} is shipped" for order_id in range(3)])
+    app.flush()
+
+    # loaded from notification_channels on first use
+    app = NotificationApp(get_factory("push"))
+    app.notify("Your driver is arriving", recipient="device-42")
+
+    if "--bench" in sys.argv:
+        asyncio.run(demo_async_notifications())
+        benchmark_template_render()
+        load_test_scheduler()
+        benchmark_rate_limiter()
+        benchmark_dedup()
+        benchmark_process_pool()
+        benchmark_outbox()
+        benchmark_registry_startup()
+        benchmark_digest()
+        benchmark_resilience()
+        benchmark_instrumentation()
+
 
 # 🧩 Factory Pattern – Practice Question
 # 📌 Problem Statement
@@ -228,13 +2666,20 @@ class NetBankingPaymentFactory(PaymentFactory):
         return NetBankingPayment()
     
 
-def get_factory(factory_type: str):
-    if factory_type == "Card":
-        return creditCardPaymentFactory()
-    elif factory_type == "UPI":
-        return UPIPaymentFactory()
-    elif factory_type == "Net":
-        return NetBankingPaymentFactory()
+# the factories are stateless, so one shared instance per type is handed out
+payment_factories = {
+    "Card": creditCardPaymentFactory(),
+    "UPI": UPIPaymentFactory(),
+    "Net": NetBankingPaymentFactory(),
+}
+
+
+def get_payment_factory(factory_type: str):
+    try:
+        return payment_factories[factory_type]
+    except KeyError:
+        raise ValueError(f"Unsupported payment type: {factory_type}") from None
     
-factory = get_factory('Card')
-print(factory.create_payment().process_payment(1500))
+if __name__ == "__main__":
+    factory = get_payment_factory('Card')
+    print(factory.create_payment().process_payment(1500))
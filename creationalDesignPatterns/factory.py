@@ -26,19 +26,101 @@ When to use:
 This example is written for LLD (Low Level Design) practice.
 """
 
+import gc
+import importlib
+import math
+import mmap
+import multiprocessing
+import os
+import struct
+import sys
+import tempfile
+import time
 from abc import ABC, abstractmethod
+from array import array
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+from typing import List, Optional
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional, Fleet columns fall back to array.array
+    np = None
 
 
 # =========================================================
 # 1. PRODUCT INTERFACE
 # =========================================================
+class _ScalarMath:
+    """
+    The few NumPy functions kinematics use, for plain floats.
+    """
+
+    cos = staticmethod(math.cos)
+    sin = staticmethod(math.sin)
+    minimum = staticmethod(min)
+    maximum = staticmethod(max)
+
+
 class Vehicle(ABC):
     """
     Product Interface
 
     All concrete products must implement this interface.
+
+    Every vehicle carries its simulation state (id, position, speed,
+    heading). reset() puts that state back to a fresh vehicle's, which
+    is what lets a pool hand the same instance out again.
+
+    How a kind moves is declared once, in kinematics(). It is written
+    against `xp` (numpy, or _ScalarMath for one vehicle), so the same
+    code steps a single object and a whole column of vehicles.
     """
 
+    __slots__ = ("vehicle_id", "x", "y", "speed", "heading", "_pooled")
+
+    # kinematics parameters, in m/s, m/s^2 and rad/s
+    max_speed = 0.0
+    acceleration = 0.0
+    turn_rate = 0.0
+
+    def __init__(self, vehicle_id: int = 0, x: float = 0.0, y: float = 0.0,
+                 speed: float = 0.0, heading: float = 0.0):
+        self._pooled = False
+        self.reset(vehicle_id, x, y, speed, heading)
+
+    def reset(self, vehicle_id: int = 0, x: float = 0.0, y: float = 0.0,
+              speed: float = 0.0, heading: float = 0.0) -> None:
+        """
+        Reset Protocol
+
+        Subclasses with extra state override this and call super().
+        """
+        self.vehicle_id = vehicle_id
+        self.x = x
+        self.y = y
+        self.speed = speed
+        self.heading = heading
+
+    @classmethod
+    def kinematics(cls, x, y, speed, heading, dt: float, xp=_ScalarMath):
+        """
+        Kinematics
+
+        Accelerates towards max_speed, turns at turn_rate and moves along
+        the heading. Returns the new (x, y, speed, heading). Subclasses
+        may override it; it must only use operators and xp functions.
+        """
+        speed = xp.minimum(speed + cls.acceleration * dt, cls.max_speed)
+        heading = heading + cls.turn_rate * dt
+        x = x + speed * xp.cos(heading) * dt
+        y = y + speed * xp.sin(heading) * dt
+        return x, y, speed, heading
+
+    def step(self, dt: float = 1.0) -> None:
+        self.x, self.y, self.speed, self.heading = type(self).kinematics(
+            self.x, self.y, self.speed, self.heading, dt)
+
     @abstractmethod
     def drive(self) -> str:
         pass
@@ -52,6 +134,11 @@ class Car(Vehicle):
     Concrete Product - Car
     """
 
+    __slots__ = ()
+
+    max_speed = 30.0
+    acceleration = 3.0
+
     def drive(self) -> str:
         return "Driving a car"
 
@@ -61,6 +148,12 @@ class Bike(Vehicle):
     Concrete Product - Bike
     """
 
+    __slots__ = ()
+
+    max_speed = 6.0
+    acceleration = 1.0
+    turn_rate = 0.05
+
     def drive(self) -> str:
         return "Riding a bike"
 
@@ -119,7 +212,1231 @@ def client_code(factory: VehicleFactory) -> None:
 
 
 # =========================================================
-# 6. APPLICATION ENTRY POINT
+# 6. POOLED FACTORY
+# =========================================================
+class PooledVehicleFactory(VehicleFactory):
+    """
+    Pooled Factory - Recycles products of another factory
+
+    create_vehicle() hands out a released instance when one is free and
+    only asks the wrapped factory for a new one when the pool is empty.
+    Callers give vehicles back with release() (or use lease() as a
+    context manager); released vehicles are reset, and at most
+    `max_size` of them are kept. Only instances of the wrapped factory's
+    product type are accepted back.
+    """
+
+    def __init__(self, factory: VehicleFactory, max_size: int = 10_000):
+        self.factory = factory
+        self.max_size = max_size
+        self._free: List[Vehicle] = []
+        self._product: Optional[type] = None
+        self.created = 0
+        self.reused = 0
+
+    def create_vehicle(self) -> Vehicle:
+        if self._free:
+            vehicle = self._free.pop()
+            vehicle._pooled = False
+            self.reused += 1
+            return vehicle
+        self.created += 1
+        vehicle = self.factory.create_vehicle()
+        self._product = type(vehicle)
+        return vehicle
+
+    def release(self, vehicle: Vehicle) -> None:
+        if type(vehicle) is not self._product:
+            raise TypeError(f"{type(vehicle).__name__} is not a product of this pool")
+        if vehicle._pooled:
+            raise ValueError("Vehicle was already released")
+        # marked even when the pool is full, so a second release is caught
+        vehicle._pooled = True
+        if len(self._free) < self.max_size:
+            vehicle.reset()
+            self._free.append(vehicle)
+
+    @contextmanager
+    def lease(self):
+        vehicle = self.create_vehicle()
+        try:
+            yield vehicle
+        finally:
+            self.release(vehicle)
+
+    def __len__(self) -> int:
+        return len(self._free)
+
+
+def benchmark_pooling(ticks: int = 400, live: int = 100_000, churn: int = 5_000) -> None:
+    """
+    Fleet churn: `live` vehicles in use; every tick `churn` of them are
+    replaced, the new ones created before the retired ones are dropped.
+    Counts allocations and garbage collector runs.
+    """
+    collections = [0]
+
+    def count_collections(phase, info):
+        if phase == "start":
+            collections[0] += 1
+
+    for label, factory in (("plain", CarFactory()),
+                           ("pooled", PooledVehicleFactory(CarFactory(), max_size=churn))):
+        pooled = isinstance(factory, PooledVehicleFactory)
+        fleet = [factory.create_vehicle() for _ in range(live)]
+        allocated = factory.created if pooled else 0
+        collections[0] = 0
+        gc.callbacks.append(count_collections)
+        start = time.perf_counter()
+        for tick in range(ticks):
+            first = (tick * churn) % live
+            retired = fleet[first:first + churn]
+            if pooled:
+                for vehicle in retired:
+                    factory.release(vehicle)
+            for slot in range(first, first + churn):
+                vehicle = factory.create_vehicle()
+                vehicle.reset(slot, 1.0, 2.0, 10.0)
+                fleet[slot] = vehicle
+            del retired
+        elapsed = time.perf_counter() - start
+        gc.callbacks.remove(count_collections)
+        allocated = factory.created - allocated if pooled else ticks * churn
+        print(f"{label:<6}: {elapsed / (ticks * churn) * 1e9:5.0f} ns/replacement,"
+              f" {allocated} vehicles allocated, {collections[0]} gc runs")
+
+
+# =========================================================
+# 7. COLUMNAR FLEET
+# =========================================================
+_COLUMNS = (("kind", "B"), ("vehicle_id", "q"), ("x", "d"), ("y", "d"),
+            ("speed", "d"), ("heading", "d"))
+
+
+def _column_property(name: str) -> property:
+    # reads the column buffer directly; ndarray.item() returns a Python scalar
+    if np is not None:
+        def get(self):
+            return self._fleet._columns[name].item(self._index)
+    else:
+        def get(self):
+            return self._fleet._columns[name][self._index]
+
+    def set(self, value):
+        self._fleet._columns[name][self._index] = value
+
+    return property(get, set)
+
+
+class Fleet:
+    """
+    Columnar Fleet - Struct-of-arrays store for vehicle state
+
+    Vehicle state lives in one column per field (type tag, id, x, y,
+    speed, heading): NumPy arrays when NumPy is installed, array.array
+    otherwise. No Vehicle object exists per row; fleet[i] builds a
+    lightweight view on demand, which is a real instance of the row's
+    product class (a Car view drives like a Car) whose fields read and
+    write the columns. Bulk operations run over whole columns at once.
+
+    Rows are dense: remove() moves the last row into the gap, so indices
+    (and views) of the last row change.
+    """
+
+    def __init__(self, kinds=(), capacity: int = 1024):
+        self.kinds: List[type] = []
+        self._views = {}
+        self._size = 0
+        # bumped whenever rows are added or removed
+        self.version = 0
+        self._capacity = max(1, capacity)
+        self._columns = {}
+        for name, typecode in _COLUMNS:
+            if np is not None:
+                self._columns[name] = np.zeros(self._capacity, dtype=typecode)
+            else:
+                self._columns[name] = array(typecode)
+        for kind in kinds:
+            self.register(kind)
+
+    # ---- kinds and views -------------------------------------------------
+    def register(self, kind: type) -> int:
+        """
+        Adds a product class (Car, Bike, ...) and returns its type tag.
+        """
+        if kind in self._views:
+            return self.kinds.index(kind)
+        if len(self.kinds) == 256:
+            raise ValueError("A fleet holds at most 256 vehicle kinds")
+        attributes = {"__slots__": ("_fleet", "_index")}
+        for name, _ in _COLUMNS[1:]:
+            attributes[name] = _column_property(name)
+        self._views[kind] = type(f"{kind.__name__}View", (kind,), attributes)
+        self.kinds.append(kind)
+        return len(self.kinds) - 1
+
+    def tag(self, kind: type) -> int:
+        try:
+            return self.kinds.index(kind)
+        except ValueError:
+            raise ValueError(f"Vehicle kind not registered: {kind.__name__}") from None
+
+    def __getitem__(self, index: int) -> Vehicle:
+        if not -self._size <= index < self._size:
+            raise IndexError("fleet index out of range")
+        index %= self._size
+        view = object.__new__(self._views[self.kinds[self._columns["kind"][index]]])
+        view._fleet = self
+        view._index = index
+        return view
+
+    def __iter__(self):
+        for index in range(self._size):
+            yield self[index]
+
+    def __len__(self) -> int:
+        return self._size
+
+    def vehicle(self, index: int) -> Vehicle:
+        """
+        Copies a row out into a standalone product instance.
+        """
+        view = self[index]
+        return self.kinds[self._columns["kind"][view._index]](view.vehicle_id, view.x, view.y,
+                                                  view.speed, view.heading)
+
+    # ---- columns -------------------------------------------------------------
+    def _column(self, name: str):
+        column = self._columns[name]
+        return column[:self._size] if np is not None else column
+
+    kind = property(lambda self: self._column("kind"))
+    vehicle_id = property(lambda self: self._column("vehicle_id"))
+    x = property(lambda self: self._column("x"))
+    y = property(lambda self: self._column("y"))
+    speed = property(lambda self: self._column("speed"))
+    heading = property(lambda self: self._column("heading"))
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Bytes held by the column buffers, including spare capacity.
+        """
+        if np is not None:
+            return sum(column.nbytes for column in self._columns.values())
+        return sum(column.buffer_info()[1] * column.itemsize for column in self._columns.values())
+
+    def _reserve(self, count: int) -> None:
+        if np is None or self._size + count <= self._capacity:
+            return
+        self._capacity = max(1, self._capacity)
+        while self._capacity < self._size + count:
+            self._capacity *= 2
+        for name, column in self._columns.items():
+            grown = np.zeros(self._capacity, dtype=column.dtype)
+            grown[:self._size] = column[:self._size]
+            self._columns[name] = grown
+
+    # ---- adding and removing rows --------------------------------------------
+    def add(self, kind: type, vehicle_id: int = 0, x: float = 0.0, y: float = 0.0,
+            speed: float = 0.0, heading: float = 0.0) -> int:
+        row = (self.tag(kind), vehicle_id, x, y, speed, heading)
+        self._reserve(1)
+        index = self._size
+        for (name, _), value in zip(_COLUMNS, row):
+            if np is not None:
+                self._columns[name][index] = value
+            else:
+                self._columns[name].append(value)
+        self._size += 1
+        self.version += 1
+        return index
+
+    def add_many(self, kind: type, count: int, vehicle_id=None, x=0.0, y=0.0,
+                 speed=0.0, heading=0.0) -> range:
+        """
+        Appends `count` vehicles of one kind. Each field is a scalar or a
+        sequence of `count` values; ids default to consecutive row numbers.
+        Returns the range of new row indices.
+        """
+        start = self._size
+        if vehicle_id is None:
+            vehicle_id = range(start, start + count)
+        values = (self.tag(kind), vehicle_id, x, y, speed, heading)
+        self._reserve(count)
+        for (name, typecode), value in zip(_COLUMNS, values):
+            column = self._columns[name]
+            if np is not None:
+                if isinstance(value, range):
+                    value = np.arange(value.start, value.stop, value.step)
+                column[start:start + count] = value
+            elif isinstance(value, (int, float)):
+                column.extend(array(typecode, [value]) * count)
+            else:
+                column.extend(array(typecode, value))
+        self._size += count
+        self.version += 1
+        return range(start, self._size)
+
+    def extend(self, vehicles) -> None:
+        for vehicle in vehicles:
+            self.add(type(vehicle), vehicle.vehicle_id, vehicle.x, vehicle.y,
+                     vehicle.speed, vehicle.heading)
+
+    def remove(self, index: int) -> None:
+        last = self._size - 1
+        if not 0 <= index <= last:
+            raise IndexError("fleet index out of range")
+        for name, column in self._columns.items():
+            column[index] = column[last]
+            if np is None:
+                column.pop()
+        self._size = last
+        self.version += 1
+
+    def remove_many(self, rows) -> None:
+        """
+        Removes several rows at once; the remaining rows keep their order.
+        """
+        if np is not None:
+            keep = np.ones(self._size, dtype=bool)
+            keep[rows] = False
+            kept = int(keep.sum())
+            for column in self._columns.values():
+                column[:kept] = column[:self._size][keep]
+            self._size = kept
+        else:
+            dropped = set(rows)
+            for name, column in self._columns.items():
+                self._columns[name] = array(column.typecode, (value for row, value in enumerate(column)
+                                                              if row not in dropped))
+            self._size = len(self._columns["kind"])
+        self.version += 1
+
+    def columns(self, rows=None) -> dict:
+        """
+        Copies of the columns (only `rows` when given), by column name.
+        Type tags refer to this fleet's kinds.
+        """
+        if np is not None:
+            if rows is None:
+                return {name: self._column(name).copy() for name, _ in _COLUMNS}
+            return {name: self._column(name)[rows] for name, _ in _COLUMNS}
+        if rows is None:
+            return {name: array(typecode, self._columns[name]) for name, typecode in _COLUMNS}
+        return {name: array(typecode, (self._columns[name][row] for row in rows))
+                for name, typecode in _COLUMNS}
+
+    def append_columns(self, columns: dict) -> range:
+        """
+        Appends rows given column by column, as returned by columns() of a
+        fleet with the same kinds in the same order.
+        """
+        count = len(columns["kind"])
+        start = self._size
+        self._reserve(count)
+        for name, typecode in _COLUMNS:
+            if np is not None:
+                self._columns[name][start:start + count] = columns[name]
+            else:
+                self._columns[name].extend(array(typecode, columns[name]))
+        self._size += count
+        self.version += 1
+        return range(start, self._size)
+
+    def group_by_kind(self) -> None:
+        """
+        Reorders rows so each kind's rows are contiguous (stable within a
+        kind). Row indices change.
+        """
+        if np is not None:
+            order = np.argsort(self.kind, kind="stable")
+            for name, column in self._columns.items():
+                column[:self._size] = column[:self._size][order]
+        else:
+            order = sorted(range(self._size), key=self._columns["kind"].__getitem__)
+            for name, column in self._columns.items():
+                self._columns[name] = array(column.typecode, (column[i] for i in order))
+        self.version += 1
+
+    # ---- bulk operations -----------------------------------------------------
+    def indices(self, kind: type = None):
+        """
+        Row indices of one kind (all rows when kind is None).
+        """
+        if kind is None:
+            return np.arange(self._size) if np is not None else range(self._size)
+        tag = self.tag(kind)
+        if np is not None:
+            return np.flatnonzero(self.kind == tag)
+        return [index for index, value in enumerate(self._columns["kind"]) if value == tag]
+
+    def count(self, kind: type = None) -> int:
+        return len(self.indices(kind)) if kind is not None else self._size
+
+    def set_speed(self, speed: float, kind: type = None) -> None:
+        self._apply("speed", lambda column: speed, kind)
+
+    def scale_speed(self, factor: float, kind: type = None) -> None:
+        self._apply("speed", lambda column: column * factor, kind)
+
+    def translate(self, dx: float, dy: float, kind: type = None) -> None:
+        self._apply("x", lambda column: column + dx, kind)
+        self._apply("y", lambda column: column + dy, kind)
+
+    def mean_speed(self, kind: type = None) -> float:
+        if np is not None:
+            speeds = self.speed if kind is None else self.speed[self.indices(kind)]
+            return float(speeds.mean()) if len(speeds) else 0.0
+        speeds = self.speed
+        rows = range(self._size) if kind is None else self.indices(kind)
+        return sum(speeds[i] for i in rows) / len(rows) if len(rows) else 0.0
+
+    def _apply(self, name: str, operation, kind: type = None) -> None:
+        # operation maps a column (NumPy array or one float) to its new value
+        if np is not None:
+            column = self._column(name)
+            if kind is None:
+                column[:] = operation(column)
+            else:
+                rows = self.kind == self.tag(kind)
+                column[rows] = operation(column[rows])
+            return
+        column = self._columns[name]
+        rows = range(self._size) if kind is None else self.indices(kind)
+        for i in rows:
+            column[i] = operation(column[i])
+
+
+def benchmark_fleet(count: int = 10_000_000) -> None:
+    """
+    Memory and iteration: `count` Car objects in a list vs one Fleet.
+    """
+    cars = [Car(i, float(i), float(i), 10.0 + i % 50) for i in range(count)]
+    # each Car plus the number objects only it refers to, and its list slot
+    sample = cars[-1000:]
+    per_car = sum(sys.getsizeof(car) + sys.getsizeof(car.vehicle_id) + sys.getsizeof(car.x)
+                  + sys.getsizeof(car.y) + sys.getsizeof(car.speed) for car in sample) / len(sample)
+    list_bytes = sys.getsizeof(cars) + per_car * count
+    start = time.perf_counter()
+    total = sum(car.speed for car in cars)
+    list_loop = time.perf_counter() - start
+    del cars, sample
+
+    fleet = Fleet([Car], capacity=count)
+    ids = np.arange(count) if np is not None else range(count)
+    fleet.add_many(Car, count, ids, ids, ids,
+                   10.0 + ids % 50 if np is not None else [10.0 + i % 50 for i in ids])
+    del ids
+    start = time.perf_counter()
+    fleet_total = fleet.mean_speed() * len(fleet)
+    fleet_bulk = time.perf_counter() - start
+    views = min(count, 1_000_000)
+    start = time.perf_counter()
+    for index in range(views):
+        fleet[index].speed
+    view_loop = (time.perf_counter() - start) * count / views
+    assert abs(total - fleet_total) <= 1e-6 * total
+
+    backend = "numpy" if np is not None else "array"
+    print(f"list of Car  : {list_bytes / count:6.1f} bytes/vehicle, sum(speed) loop {list_loop:6.2f} s")
+    print(f"Fleet ({backend}): {fleet.nbytes / count:6.1f} bytes/vehicle, bulk mean(speed) {fleet_bulk:6.3f} s,"
+          f" per-row views ~{view_loop:6.2f} s")
+
+
+# =========================================================
+# 8. SIMULATION ENGINE
+# =========================================================
+class FleetSimulation:
+    """
+    Simulation Engine - Advances a whole Fleet per tick
+
+    Each tick applies every kind's kinematics once to all of that kind's
+    rows: the columns are gathered by kind, passed through
+    kind.kinematics(..., xp=numpy) as whole arrays and written back, so
+    the per-vehicle work happens inside NumPy. Row indices per kind are
+    cached until the fleet changes. Without NumPy each row is stepped
+    with the scalar kinematics instead.
+    """
+
+    def __init__(self, fleet: Fleet):
+        self.fleet = fleet
+        self.ticks = 0
+        self.time = 0.0
+        self._groups = None
+        self._version = -1
+
+    def _kind_groups(self):
+        # [(kind, rows)], rebuilt when rows change; rows is a slice when the
+        # kind's rows are contiguous (updated in place), else an index array
+        fleet = self.fleet
+        if self._version != fleet.version:
+            kinds = fleet.kind
+            self._groups = []
+            for tag, kind in enumerate(fleet.kinds):
+                rows = np.flatnonzero(kinds == tag)
+                if not len(rows):
+                    continue
+                if rows[-1] - rows[0] + 1 == len(rows):
+                    rows = slice(int(rows[0]), int(rows[-1]) + 1)
+                self._groups.append((kind, rows))
+            self._version = fleet.version
+        return self._groups
+
+    def tick(self, dt: float = 1.0) -> None:
+        fleet = self.fleet
+        if np is None:
+            for vehicle in fleet:
+                vehicle.step(dt)
+        else:
+            columns = (fleet.x, fleet.y, fleet.speed, fleet.heading)
+            for kind, rows in self._kind_groups():
+                if isinstance(rows, slice):
+                    views = [column[rows] for column in columns]
+                    state = kind.kinematics(*views, dt, np)
+                    for view, value in zip(views, state):
+                        view[:] = value
+                else:
+                    state = kind.kinematics(*(column[rows] for column in columns), dt, np)
+                    for column, value in zip(columns, state):
+                        column[rows] = value
+        self.ticks += 1
+        self.time += dt
+
+    def run(self, ticks: int, dt: float = 1.0) -> None:
+        for _ in range(ticks):
+            self.tick(dt)
+
+
+def benchmark_simulation(count: int = 1_000_000, ticks: int = 20, sample: int = 20_000) -> None:
+    """
+    Ticks per second for `count` mixed Car/Bike vehicles, against calling
+    step() on every Vehicle object.
+    """
+    fleet = Fleet([Car, Bike], capacity=count)
+    for index in range(count):
+        # interleaved kinds, so every tick really gathers and scatters by kind
+        fleet.add(Car if index % 3 else Bike, index, heading=index % 628 / 100)
+    simulation = FleetSimulation(fleet)
+    simulation.tick(0.1)
+    start = time.perf_counter()
+    simulation.run(ticks, 0.1)
+    interleaved = ticks / (time.perf_counter() - start)
+    fleet.group_by_kind()
+    simulation.tick(0.1)
+    start = time.perf_counter()
+    simulation.run(ticks, 0.1)
+    grouped = ticks / (time.perf_counter() - start)
+
+    vehicles = [fleet.vehicle(index) for index in range(sample)]
+    start = time.perf_counter()
+    for _ in range(ticks):
+        for vehicle in vehicles:
+            vehicle.step(0.1)
+    per_object = ticks / (time.perf_counter() - start) * sample / count
+
+    backend = "numpy" if np is not None else "array, per row"
+    print(f"FleetSimulation ({backend}), interleaved kinds: {interleaved:8.2f} ticks/s for {count} vehicles")
+    print(f"FleetSimulation ({backend}), grouped by kind  : {grouped:8.2f} ticks/s")
+    print(f"Vehicle.step() loop{' ' * len(backend)}                : {per_object:8.2f} ticks/s"
+          f" (from {sample} vehicles)")
+
+
+# =========================================================
+# 9. SPATIAL INDEX
+# =========================================================
+def _ring_cells(cx: int, cy: int, ring: int, extent: tuple):
+    # cells at Chebyshev distance `ring` from (cx, cy), clipped to the
+    # occupied extent so far rings don't enumerate thousands of empty cells
+    low_x, high_x, low_y, high_y = extent
+    first_x, last_x = max(cx - ring, low_x), min(cx + ring, high_x)
+    for cell_y in ((cy - ring, cy + ring) if ring else (cy,)):
+        if low_y <= cell_y <= high_y:
+            for cell_x in range(first_x, last_x + 1):
+                yield cell_x, cell_y
+    first_y, last_y = max(cy - ring + 1, low_y), min(cy + ring - 1, high_y)
+    for cell_x in ((cx - ring, cx + ring) if ring else ()):
+        if low_x <= cell_x <= high_x:
+            for cell_y in range(first_y, last_y + 1):
+                yield cell_x, cell_y
+
+
+class FleetGrid:
+    """
+    Spatial Index - Uniform grid hash over a Fleet's positions
+
+    Rows are bucketed by (kind tag, cell x, cell y), so a type filter only
+    ever looks at that kind's buckets. update() after a tick recomputes
+    every row's cell in one vectorized pass and moves just the rows that
+    changed cell; when rows were added or removed it rebuilds.
+
+    k-nearest queries walk square rings of cells outwards from the query
+    point, starting at the first ring that reaches the occupied extent and
+    visiting only the cells inside it, and stop once the k-th best
+    distance is no larger than the distance to the next ring.
+    """
+
+    def __init__(self, fleet: Fleet, cell_size: float = 100.0):
+        self.fleet = fleet
+        self.cell_size = cell_size
+        self._buckets = {}
+        self._cells = None
+        self._version = -1
+        self.moved = 0
+        self.update()
+
+    def _cell_columns(self):
+        fleet = self.fleet
+        if np is not None:
+            return (np.floor(fleet.x / self.cell_size).astype(np.int64),
+                    np.floor(fleet.y / self.cell_size).astype(np.int64))
+        size = self.cell_size
+        return (array("q", (math.floor(x / size) for x in fleet.x)),
+                array("q", (math.floor(y / size) for y in fleet.y)))
+
+    def update(self) -> int:
+        """
+        Re-buckets rows after vehicles moved; returns how many changed cell.
+        """
+        cx, cy = self._cell_columns()
+        kinds = self.fleet.kind
+        buckets = self._buckets
+        if self._version != self.fleet.version:
+            buckets.clear()
+            for row, key in enumerate(zip(kinds, cx, cy)):
+                if np is not None:
+                    key = (int(key[0]), int(key[1]), int(key[2]))
+                buckets.setdefault(key, set()).add(row)
+            moved = len(self.fleet)
+            self._version = self.fleet.version
+        else:
+            old_x, old_y = self._cells
+            if np is not None:
+                rows = np.flatnonzero((cx != old_x) | (cy != old_y)).tolist()
+            else:
+                rows = [row for row in range(len(cx)) if cx[row] != old_x[row] or cy[row] != old_y[row]]
+            for row in rows:
+                tag = int(kinds[row])
+                old_key = (tag, int(old_x[row]), int(old_y[row]))
+                bucket = buckets[old_key]
+                bucket.discard(row)
+                if not bucket:
+                    del buckets[old_key]
+                buckets.setdefault((tag, int(cx[row]), int(cy[row])), set()).add(row)
+            moved = len(rows)
+        self._cells = (cx, cy)
+        # occupied cell range, so a ring search knows when nothing is left
+        if not len(cx):
+            self._extent = (0, -1, 0, -1)
+        elif np is not None:
+            self._extent = (int(cx.min()), int(cx.max()), int(cy.min()), int(cy.max()))
+        else:
+            self._extent = (min(cx), max(cx), min(cy), max(cy))
+        self.moved += moved
+        return moved
+
+    def _tags(self, kind: type = None) -> List[int]:
+        return list(range(len(self.fleet.kinds))) if kind is None else [self.fleet.tag(kind)]
+
+    def _distances(self, rows: List[int], x: float, y: float):
+        fleet = self.fleet
+        if np is not None:
+            rows = np.fromiter(rows, dtype=np.int64, count=len(rows))
+            return rows, np.hypot(fleet.x[rows] - x, fleet.y[rows] - y)
+        xs, ys = fleet.x, fleet.y
+        return rows, [math.hypot(xs[row] - x, ys[row] - y) for row in rows]
+
+    def nearest(self, x: float, y: float, k: int = 1, kind: type = None) -> List[tuple]:
+        """
+        The k rows nearest to (x, y) as (distance, row), closest first.
+        """
+        if k <= 0:
+            return []
+        size = self.cell_size
+        tags = self._tags(kind)
+        cx, cy = math.floor(x / size), math.floor(y / size)
+        extent = low_x, high_x, low_y, high_y = self._extent
+        first_ring = max(low_x - cx, cx - high_x, low_y - cy, cy - high_y, 0)
+        last_ring = max(cx - low_x, high_x - cx, cy - low_y, high_y - cy)
+        buckets = self._buckets
+        best: List[tuple] = []
+        for ring in range(first_ring, last_ring + 1):
+            rows = []
+            for cell_x, cell_y in _ring_cells(cx, cy, ring, extent):
+                for tag in tags:
+                    bucket = buckets.get((tag, cell_x, cell_y))
+                    if bucket:
+                        rows.extend(bucket)
+            if rows:
+                rows, distances = self._distances(rows, x, y)
+                if np is not None:
+                    rows, distances = rows.tolist(), distances.tolist()
+                best.extend(zip(distances, rows))
+                best.sort()
+                del best[k:]
+            # every row not visited yet is at least ring * size away
+            if len(best) == k and best[-1][0] <= ring * size:
+                break
+        return best
+
+    def within(self, x: float, y: float, radius: float, kind: type = None) -> List[tuple]:
+        """
+        Rows within `radius` of (x, y) as (distance, row), closest first.
+        """
+        size = self.cell_size
+        # only cells inside the occupied extent can hold rows
+        low_x, high_x, low_y, high_y = self._extent
+        cells_x = range(max(math.floor((x - radius) / size), low_x),
+                        min(math.floor((x + radius) / size), high_x) + 1)
+        cells_y = range(max(math.floor((y - radius) / size), low_y),
+                        min(math.floor((y + radius) / size), high_y) + 1)
+        rows = []
+        for tag in self._tags(kind):
+            for cell_x in cells_x:
+                for cell_y in cells_y:
+                    bucket = self._buckets.get((tag, cell_x, cell_y))
+                    if bucket:
+                        rows.extend(bucket)
+        if not rows:
+            return []
+        rows, distances = self._distances(rows, x, y)
+        if np is not None:
+            inside = distances <= radius
+            return sorted(zip(distances[inside].tolist(), rows[inside].tolist()))
+        return sorted((distance, row) for distance, row in zip(distances, rows) if distance <= radius)
+
+
+def _scan_nearest(fleet: Fleet, x: float, y: float, k: int, kind: type) -> List[tuple]:
+    # linear scan baseline: every row's distance, vectorized
+    rows = np.flatnonzero(fleet.kind == fleet.tag(kind))
+    distances = np.hypot(fleet.x[rows] - x, fleet.y[rows] - y)
+    nearest = np.argpartition(distances, k)[:k]
+    return sorted(zip(distances[nearest].tolist(), rows[nearest].tolist()))
+
+
+def _scan_within(fleet: Fleet, x: float, y: float, radius: float, kind: type) -> List[tuple]:
+    rows = np.flatnonzero(fleet.kind == fleet.tag(kind))
+    distances = np.hypot(fleet.x[rows] - x, fleet.y[rows] - y)
+    inside = distances <= radius
+    return sorted(zip(distances[inside].tolist(), rows[inside].tolist()))
+
+
+def benchmark_spatial_index(sizes=(100_000, 1_000_000), queries: int = 1_000,
+                            area: float = 10_000.0) -> None:
+    """
+    k-nearest (k=5) and radius (200 m) queries for Bikes in a 10 km square:
+    FleetGrid against a vectorized linear scan over the whole fleet.
+    """
+    if np is None:
+        print("benchmark_spatial_index needs numpy for its linear scan baseline")
+        return
+    random = np.random.default_rng(7)
+    points = random.uniform(0, area, size=(queries, 2)).tolist()
+    for count in sizes:
+        fleet = Fleet([Car, Bike], capacity=count)
+        fleet.add_many(Car, count - count // 4, None, random.uniform(0, area, count - count // 4),
+                       random.uniform(0, area, count - count // 4), 10.0,
+                       random.uniform(0, 2 * math.pi, count - count // 4))
+        fleet.add_many(Bike, count // 4, None, random.uniform(0, area, count // 4),
+                       random.uniform(0, area, count // 4), 4.0,
+                       random.uniform(0, 2 * math.pi, count // 4))
+        # about 16 vehicles per cell
+        start = time.perf_counter()
+        grid = FleetGrid(fleet, cell_size=math.sqrt(area * area * 16 / count))
+        build = time.perf_counter() - start
+        FleetSimulation(fleet).tick(1.0)
+        start = time.perf_counter()
+        moved = grid.update()
+        update = time.perf_counter() - start
+
+        for label, indexed, scanned in (
+                ("5-nearest", lambda p: grid.nearest(*p, k=5, kind=Bike),
+                 lambda p: _scan_nearest(fleet, *p, 5, Bike)),
+                ("radius 200m", lambda p: grid.within(*p, 200.0, kind=Bike),
+                 lambda p: _scan_within(fleet, *p, 200.0, Bike))):
+            scan_points = points[:max(10, queries * 100_000 // count)]
+            start = time.perf_counter()
+            expected = [scanned(point) for point in scan_points]
+            scan_rate = len(scan_points) / (time.perf_counter() - start)
+            start = time.perf_counter()
+            results = [indexed(point) for point in points]
+            grid_rate = queries / (time.perf_counter() - start)
+            assert [[row for _, row in result] for result in results[:len(expected)]] == \
+                   [[row for _, row in result] for result in expected]
+            print(f"{count:>8} vehicles, {label:<11}: grid {grid_rate:8.0f} queries/s,"
+                  f" linear scan {scan_rate:6.0f} queries/s")
+        print(f"{count:>8} vehicles: grid build {build:.2f} s, update after a tick"
+              f" {update * 1e3:.0f} ms ({moved} rows changed cell)")
+
+
+# =========================================================
+# 10. SHARDED SIMULATION
+# =========================================================
+class _Mailboxes:
+    """
+    Boundary crossings between shards, in multiprocessing.shared_memory.
+
+    One float64 box per (tick parity, source shard, destination shard):
+    a row count, then up to `capacity` rows of (kind, id, x, y, speed,
+    heading). Ticks alternate between the two parities, so a shard can
+    write the next tick's crossings while slower shards still read this
+    tick's, and one barrier per tick is enough.
+    """
+
+    def __init__(self, shards: int, capacity: int):
+        self.shards = shards
+        self.capacity = capacity
+        self._shape = (2, shards, shards, 1 + capacity * len(_COLUMNS))
+        size = int(np.prod(self._shape)) * 8
+        self._memory = shared_memory.SharedMemory(create=True, size=size)
+        self.boxes = np.ndarray(self._shape, dtype=np.float64, buffer=self._memory.buf)
+        self.boxes[..., 0] = 0
+
+    def __getstate__(self) -> dict:
+        return {"shards": self.shards, "capacity": self.capacity, "_shape": self._shape,
+                "_memory": self._memory.name}
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        # workers share the parent's resource tracker; only the parent unlinks
+        self._memory = shared_memory.SharedMemory(name=state["_memory"])
+        self.boxes = np.ndarray(self._shape, dtype=np.float64, buffer=self._memory.buf)
+
+    def send(self, parity: int, source: int, destination: int, rows: dict) -> int:
+        # writes as many rows as fit and returns how many that was
+        count = min(len(rows["kind"]), self.capacity)
+        box = self.boxes[parity, source, destination]
+        body = box[1:].reshape(len(_COLUMNS), self.capacity)
+        for field, (name, _) in enumerate(_COLUMNS):
+            body[field, :count] = rows[name][:count]
+        box[0] = count
+        return count
+
+    def receive(self, parity: int, source: int, destination: int) -> dict:
+        box = self.boxes[parity, source, destination]
+        count = int(box[0])
+        body = box[1:].reshape(len(_COLUMNS), self.capacity)
+        rows = {name: body[field, :count].astype(typecode)
+                for field, (name, typecode) in enumerate(_COLUMNS)}
+        box[0] = 0
+        return rows
+
+    def close(self):
+        del self.boxes  # the buffer cannot be closed while a view exists
+        self._memory.close()
+
+    def unlink(self):
+        self._memory.unlink()
+
+
+def _shard_worker(index: int, kinds: list, bounds: tuple, mailboxes: _Mailboxes,
+                  barrier, connection, timeout: float):
+    """
+    Owns the vehicles whose x falls in strip `index` of the world. Every
+    tick: simulate, wrap positions round the world, post the rows that
+    left the strip to their new shard, wait for all shards, take in the
+    rows posted to this one.
+
+    A worker that fails breaks the barrier on its way out, so the other
+    shards stop with BrokenBarrierError instead of waiting for it.
+    """
+    try:
+        _shard_loop(index, kinds, bounds, mailboxes, barrier, connection, timeout)
+    except BaseException:
+        barrier.abort()
+        raise
+    finally:
+        mailboxes.close()
+        connection.close()
+
+
+def _shard_loop(index: int, kinds: list, bounds: tuple, mailboxes: _Mailboxes,
+                barrier, connection, timeout: float):
+    width, height, shards = bounds
+    strip = width / shards
+    fleet = Fleet(kinds)
+    simulation = FleetSimulation(fleet)
+    parity = 0
+    while True:
+        command, *args = connection.recv()
+        if command == "add":
+            fleet.append_columns(args[0])
+            connection.send(len(fleet))
+        elif command == "run":
+            ticks, dt = args
+            crossings = 0
+            for _ in range(ticks):
+                simulation.tick(dt)
+                x, y = fleet.x, fleet.y
+                np.mod(x, width, out=x)
+                np.mod(y, height, out=y)
+                owner = np.minimum((x // strip).astype(np.int64), shards - 1)
+                leaving = np.flatnonzero(owner != index)
+                sent = []
+                for destination in range(shards):
+                    if destination == index:
+                        continue
+                    rows = leaving[owner[leaving] == destination]
+                    # rows that do not fit stay here and try again next tick
+                    count = mailboxes.send(parity, index, destination, fleet.columns(rows))
+                    sent.append(rows[:count])
+                if sent:
+                    sent = np.concatenate(sent)
+                    fleet.remove_many(sent)
+                    crossings += len(sent)
+                barrier.wait(timeout)
+                for source in range(shards):
+                    if source != index:
+                        rows = mailboxes.receive(parity, source, index)
+                        if len(rows["kind"]):
+                            fleet.append_columns(rows)
+                parity ^= 1
+            connection.send((len(fleet), crossings))
+        elif command == "gather":
+            connection.send(fleet.columns())
+        elif command == "stop":
+            break
+
+
+class ShardedFleetSimulation:
+    """
+    Sharded Simulation - One worker process per region of the world
+
+    The world is a width x height torus cut into vertical strips, one per
+    shard. Each worker keeps its strip's vehicles in its own Fleet and
+    advances them with FleetSimulation; vehicles that cross into another
+    strip are handed over through shared-memory mailboxes at the end of
+    each tick, with one barrier per tick keeping the shards in step.
+    Populations are added per factory, so the products' kinematics decide
+    how each kind moves.
+
+    If a shard fails (or a tick waits longer than `timeout` seconds on
+    the barrier) the shards stop and every later call raises RuntimeError.
+    """
+
+    _POLL = 0.1
+
+    def __init__(self, kinds=(Car, Bike), shards: int = 4, width: float = 10_000.0,
+                 height: float = 10_000.0, mailbox_capacity: int = 10_000, context=None,
+                 timeout: float = 60.0):
+        if np is None:
+            raise ImportError("ShardedFleetSimulation requires numpy")
+        context = context or multiprocessing.get_context()
+        self.kinds = list(kinds)
+        self.shards = shards
+        self.width = width
+        self.height = height
+        self.ticks = 0
+        self._next_id = 0
+        self._mailboxes = _Mailboxes(shards, mailbox_capacity)
+        # kept on self: under spawn the children unpickle it after start()
+        self._barrier = context.Barrier(shards)
+        self._connections = []
+        self._workers = []
+        for index in range(shards):
+            parent, child = context.Pipe()
+            worker = context.Process(
+                target=_shard_worker, name=f"fleet-shard-{index}", daemon=True,
+                args=(index, self.kinds, (width, height, shards), self._mailboxes, self._barrier, child,
+                      timeout))
+            worker.start()
+            child.close()  # so recv() sees EOF once the worker has gone
+            self._connections.append(parent)
+            self._workers.append(worker)
+        self.closed = False
+
+    def _receive(self, index: int):
+        # waits for shard `index`'s reply, checking that it is still running
+        connection, worker = self._connections[index], self._workers[index]
+        while not connection.poll(self._POLL):
+            if not worker.is_alive():
+                break
+        try:
+            return connection.recv()
+        except EOFError:
+            worker.join()
+            raise RuntimeError(f"{worker.name} exited with code {worker.exitcode}") from None
+
+    def _broadcast(self, *command) -> list:
+        for connection in self._connections:
+            connection.send(command)
+        return [self._receive(index) for index in range(self.shards)]
+
+    def add(self, factory: VehicleFactory, count: int, speed: float = 0.0, seed=None) -> None:
+        """
+        Adds `count` vehicles of the factory's product at random positions
+        and headings, each sent to the shard that owns its position.
+        """
+        kind = type(factory.create_vehicle())
+        random = np.random.default_rng(seed)
+        ids = np.arange(self._next_id, self._next_id + count)
+        self._next_id += count
+        x = random.uniform(0, self.width, count)
+        rows = {"kind": np.full(count, self.kinds.index(kind), dtype=np.uint8),
+                "vehicle_id": ids, "x": x, "y": random.uniform(0, self.height, count),
+                "speed": np.full(count, speed), "heading": random.uniform(0, 2 * math.pi, count)}
+        owner = np.minimum((x // (self.width / self.shards)).astype(np.int64), self.shards - 1)
+        for index, connection in enumerate(self._connections):
+            mine = owner == index
+            connection.send(("add", {name: column[mine] for name, column in rows.items()}))
+        for index in range(self.shards):
+            self._receive(index)
+
+    def run(self, ticks: int, dt: float = 1.0) -> int:
+        """
+        Advances every shard `ticks` ticks; returns the number of boundary
+        crossings handed over.
+        """
+        results = self._broadcast("run", ticks, dt)
+        self.ticks += ticks
+        return sum(crossings for _, crossings in results)
+
+    def populations(self) -> List[int]:
+        return [population for population, _ in self._broadcast("run", 0, 0.0)]
+
+    def gather(self) -> Fleet:
+        """
+        Collects every shard's vehicles into one Fleet.
+        """
+        fleet = Fleet(self.kinds)
+        for columns in self._broadcast("gather"):
+            fleet.append_columns(columns)
+        return fleet
+
+    def close(self) -> None:
+        if not self.closed:
+            self.closed = True
+            try:
+                for connection in self._connections:
+                    try:
+                        connection.send(("stop",))
+                    except OSError:
+                        pass  # that worker has already exited
+                for worker in self._workers:
+                    worker.join()
+            finally:
+                self._mailboxes.close()
+                self._mailboxes.unlink()
+
+    def __enter__(self) -> "ShardedFleetSimulation":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def benchmark_sharded_simulation(count: int = 2_000_000, ticks: int = 20,
+                                 shard_counts=(1, 2, 4, 8)) -> None:
+    """
+    Ticks per second for `count` mixed Car/Bike vehicles against the
+    number of shard processes (speedup only shows with that many cores).
+    """
+    if np is None:
+        print("benchmark_sharded_simulation needs numpy")
+        return
+    print(f"{os.cpu_count()} CPU(s) available")
+    baseline = None
+    for shards in shard_counts:
+        with ShardedFleetSimulation(shards=shards) as simulation:
+            simulation.add(CarFactory(), count * 3 // 4, speed=15.0, seed=1)
+            simulation.add(BikeFactory(), count - count * 3 // 4, speed=5.0, seed=2)
+            simulation.run(1, 1.0)
+            start = time.perf_counter()
+            crossings = simulation.run(ticks, 1.0)
+            rate = ticks / (time.perf_counter() - start)
+            assert sum(simulation.populations()) == count
+        baseline = baseline or rate
+        print(f"{shards} shard(s): {rate:6.2f} ticks/s ({rate / baseline:4.2f}x),"
+              f" {crossings / ticks:8.0f} crossings/tick")
+
+
+# =========================================================
+# 11. SNAPSHOTS
+# =========================================================
+class FleetSnapshot:
+    """
+    Snapshot - Columnar binary file of a Fleet's state
+
+    File format (all integers little-endian):
+
+        offset 0   magic      8 bytes  b"FLEETSN1"
+                   rows       <Q>      number of vehicles
+                   kinds      <I>      number of vehicle kinds
+                   columns    <I>      number of columns (6)
+        then, per kind (its position is the row's type tag):
+                   length     <H>      then "module:QualName" in utf-8
+        then, per column:
+                   name       16 bytes utf-8, NUL padded
+                   dtype      4 bytes  NumPy dtype string, e.g. "<f8"
+                   offset     <Q>      start of the column's data
+        then the column data: rows values of the column's dtype, each
+        column starting on a 64-byte boundary.
+
+    load() maps the file (copy-on-write) and wraps every column with
+    numpy.frombuffer, so no vehicle data is read or copied until it is
+    used and load time does not depend on the fleet size. Writes to a
+    loaded fleet never reach the file.
+    """
+
+    MAGIC = b"FLEETSN1"
+    ALIGN = 64
+    _HEADER = struct.Struct("<8sQII")
+    _COLUMN = struct.Struct("<16s4sQ")
+
+    @classmethod
+    def _dtypes(cls) -> dict:
+        return {"kind": "<u1", "vehicle_id": "<i8", "x": "<f8", "y": "<f8",
+                "speed": "<f8", "heading": "<f8"}
+
+    @classmethod
+    def save(cls, fleet: Fleet, path: str) -> int:
+        """
+        Writes the snapshot and returns its size in bytes.
+        """
+        rows = len(fleet)
+        dtypes = cls._dtypes()
+        header = bytearray(cls._HEADER.pack(cls.MAGIC, rows, len(fleet.kinds), len(_COLUMNS)))
+        for kind in fleet.kinds:
+            name = f"{kind.__module__}:{kind.__qualname__}".encode()
+            header += struct.pack("<H", len(name)) + name
+        offset = len(header) + cls._COLUMN.size * len(_COLUMNS)
+        descriptors = bytearray()
+        for name, _ in _COLUMNS:
+            offset = -(-offset // cls.ALIGN) * cls.ALIGN
+            descriptors += cls._COLUMN.pack(name.encode(), dtypes[name].encode(), offset)
+            offset += rows * int(dtypes[name][2:])
+        with open(path, "wb") as file:
+            file.write(header)
+            file.write(descriptors)
+            for name, _ in _COLUMNS:
+                file.write(bytes(-file.tell() % cls.ALIGN))
+                column = getattr(fleet, name)
+                if np is not None:
+                    file.write(column.astype(dtypes[name], copy=False).tobytes())
+                else:
+                    if sys.byteorder != "little":
+                        column = array(column.typecode, column)
+                        column.byteswap()
+                    file.write(column.tobytes())
+            return file.tell()
+
+    @classmethod
+    def _resolve(cls, name: str, kinds) -> type:
+        module_name, _, qualname = name.partition(":")
+        for kind in kinds or ():
+            if kind.__qualname__ == qualname:
+                return kind
+        target = importlib.import_module(module_name)
+        for part in qualname.split("."):
+            target = getattr(target, part)
+        return target
+
+    @classmethod
+    def load(cls, path: str, kinds=None) -> Fleet:
+        """
+        Opens a snapshot as a Fleet. Kinds are imported from their
+        recorded module unless a class with the same name is in `kinds`.
+        """
+        with open(path, "rb") as file:
+            memory = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_COPY)
+        magic, rows, kind_count, column_count = cls._HEADER.unpack_from(memory, 0)
+        if magic != cls.MAGIC:
+            raise ValueError(f"Not a fleet snapshot: {path}")
+        position = cls._HEADER.size
+        fleet = Fleet()
+        for _ in range(kind_count):
+            (length,) = struct.unpack_from("<H", memory, position)
+            name = memory[position + 2:position + 2 + length].decode()
+            fleet.register(cls._resolve(name, kinds))
+            position += 2 + length
+        for _ in range(column_count):
+            raw_name, dtype, offset = cls._COLUMN.unpack_from(memory, position)
+            position += cls._COLUMN.size
+            name = raw_name.rstrip(b"\0").decode()
+            if np is not None:
+                dtype = dtype.rstrip(b"\0").decode()
+                column = np.frombuffer(memory, dtype=dtype, count=rows, offset=offset)
+            else:
+                column = array(dict(_COLUMNS)[name])
+                column.frombytes(memory[offset:offset + rows * column.itemsize])
+                if sys.byteorder != "little":
+                    column.byteswap()
+            fleet._columns[name] = column
+        fleet._size = rows
+        fleet._capacity = rows
+        fleet.version += 1
+        # the views point into the mapping, so it lives as long as the fleet
+        fleet._snapshot = memory if np is not None else None
+        return fleet
+
+
+def verify_snapshot_roundtrip() -> None:
+    """
+    Save and load a small fleet and an empty one: every column and kind
+    comes back, and the loaded fleet can be modified and grown without
+    touching the file.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        fleet = Fleet([Car, Bike])
+        fleet.add_many(Car, 1000, None, range(1000), range(0, 2000, 2), 12.5, 0.25)
+        fleet.add_many(Bike, 500, range(5000, 5500), 1.5, -2.5, 4.0, 3.0)
+        path = os.path.join(directory, "roundtrip.fleet")
+        FleetSnapshot.save(fleet, path)
+        loaded = FleetSnapshot.load(path)
+        assert loaded.kinds == fleet.kinds and len(loaded) == len(fleet)
+        for name, _ in _COLUMNS:
+            assert list(getattr(loaded, name)) == list(getattr(fleet, name)), name
+        assert isinstance(loaded[1200], Bike) and loaded[1200].vehicle_id == 5200
+        loaded.scale_speed(2.0)
+        loaded.add(Car, 9999)
+        assert len(loaded) == 1501 and loaded[1500].vehicle_id == 9999
+        assert FleetSnapshot.load(path).speed[0] == 12.5  # the file is unchanged
+
+        empty = os.path.join(directory, "empty.fleet")
+        FleetSnapshot.save(Fleet([Car]), empty)
+        loaded = FleetSnapshot.load(empty)
+        assert len(loaded) == 0
+        loaded.add(Car, 1, speed=3.0)
+        assert len(loaded) == 1 and loaded[0].speed == 3.0
+    print("snapshot round trip: ok")
+
+
+def benchmark_snapshot(sizes=(1_000_000, 10_000_000), rebuild_sample: int = 200_000) -> None:
+    """
+    Save and load times against rebuilding every Vehicle through the
+    factories.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        factory = CarFactory()
+        for index in range(rebuild_sample):
+            factory.create_vehicle().reset(index, 1.0, 2.0, 10.0)
+        rebuild_per_vehicle = (time.perf_counter() - start) / rebuild_sample
+
+        for count in sizes:
+            fleet = Fleet([Car, Bike], capacity=count)
+            fleet.add_many(Car, count // 2, speed=10.0)
+            fleet.add_many(Bike, count - count // 2, speed=4.0)
+            path = os.path.join(directory, f"fleet-{count}.fleet")
+            start = time.perf_counter()
+            size = FleetSnapshot.save(fleet, path)
+            save = time.perf_counter() - start
+            del fleet
+            start = time.perf_counter()
+            loaded = FleetSnapshot.load(path)
+            load = time.perf_counter() - start
+            start = time.perf_counter()
+            mean = loaded.mean_speed()
+            first_pass = time.perf_counter() - start
+            assert len(loaded) == count and abs(mean - 7.0) < 1e-9
+            print(f"{count:>9} vehicles ({size / 2**20:6.1f} MiB): save {save * 1e3:7.1f} ms,"
+                  f" load {load * 1e3:6.2f} ms, first full column pass {first_pass * 1e3:6.1f} ms,"
+                  f" rebuild through factories ~{rebuild_per_vehicle * count:6.1f} s")
+            del loaded
+
+
+# =========================================================
+# 12. APPLICATION ENTRY POINT
 # =========================================================
 if __name__ == "__main__":
     """
@@ -138,6 +1455,36 @@ if __name__ == "__main__":
     bike_factory = BikeFactory()
     client_code(bike_factory)
 
+    pool = PooledVehicleFactory(car_factory)
+    with pool.lease() as vehicle:
+        print(vehicle.drive())
+
+    fleet = Fleet([Car, Bike])
+    fleet.add_many(Car, 3, speed=15.0)
+    fleet.add(Bike, vehicle_id=100, speed=5.0)
+    fleet.scale_speed(2.0, kind=Bike)
+    for vehicle in fleet:
+        print(vehicle.vehicle_id, vehicle.drive(), vehicle.speed)
+
+    simulation = FleetSimulation(fleet)
+    simulation.run(10, dt=0.5)
+    for vehicle in fleet:
+        print(f"{vehicle.vehicle_id} at ({vehicle.x:.1f}, {vehicle.y:.1f}), {vehicle.speed:.1f} m/s")
+
+    grid = FleetGrid(fleet, cell_size=50.0)
+    for distance, row in grid.nearest(0.0, 0.0, k=2, kind=Car):
+        print(f"car {fleet[row].vehicle_id} is {distance:.1f} m away")
+
+    verify_snapshot_roundtrip()
+
+    if "--bench" in sys.argv:
+        benchmark_pooling()
+        benchmark_fleet()
+        benchmark_simulation()
+        benchmark_spatial_index()
+        benchmark_sharded_simulation()
+        benchmark_snapshot()
+
 
 
 # 🧪 Factory Method Pattern – Coding Test
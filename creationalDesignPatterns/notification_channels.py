@@ -0,0 +1,144 @@
+"""
+Extra notification families for abstract_factory.py: push, webhook, in-app.
+
+This module is registered in abstract_factory's factory registry by import
+path only, so it (and the client libraries it pulls in) is loaded on the
+first get_factory() for one of these channels, not at startup.
+"""
+
+import json
+import os
+import sys
+import urllib.request
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+if __package__:
+    from . import abstract_factory as _base
+elif os.path.basename(getattr(sys.modules["__main__"], "__file__", None) or "") == "abstract_factory.py":
+    # abstract_factory.py is running as a script: use that module, since
+    # importing it by name would load a second copy with its own registry
+    # and classes
+    _base = sys.modules["__main__"]
+else:  # this directory is on sys.path
+    import abstract_factory as _base
+
+BufferedMessageSender = _base.BufferedMessageSender
+MessageFormatter = _base.MessageFormatter
+MessageSender = _base.MessageSender
+NotificationFactory = _base.NotificationFactory
+TemplateMessageFormatter = _base.TemplateMessageFormatter
+
+
+# ============================================================
+# 1. PUSH FAMILY
+# ============================================================
+
+class PushMessageSender(BufferedMessageSender):
+    def send_message(self, message: str, recipient: Optional[str] = None):
+        if recipient is None:
+            print(f"PUSH SENT: {message}")
+        else:
+            print(f"PUSH SENT to {recipient}: {message}")
+
+    def deliver(self, batch: List[str]):
+        print("\n".join(f"PUSH SENT: {message}" for message in batch))
+
+
+class PushMessageFormatter(TemplateMessageFormatter):
+    def __init__(self, template: str = "[PUSH FORMAT] {message}", cache: bool = True):
+        super().__init__(template, cache)
+
+
+class PushNotificationFactory(NotificationFactory):
+    channel = "push"
+
+    def create_sender(self) -> MessageSender:
+        return PushMessageSender()
+
+    def create_formatter(self) -> MessageFormatter:
+        return PushMessageFormatter()
+
+
+# ============================================================
+# 2. WEBHOOK FAMILY
+# ============================================================
+
+class WebhookMessageSender(BufferedMessageSender):
+    """
+    POSTs each batch as a JSON array to `url`; without a url the
+    payload is printed instead.
+    """
+
+    def __init__(self, url: Optional[str] = None, timeout: float = 5.0, **kwargs):
+        super().__init__(**kwargs)
+        self.url = url
+        self.timeout = timeout
+
+    def _post(self, payload: list):
+        body = json.dumps(payload).encode()
+        if self.url is None:
+            print(f"WEBHOOK SENT: {body.decode()}")
+            return
+        request = urllib.request.Request(
+            self.url, data=body, headers={"Content-Type": "application/json"}, method="POST")
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+    def send_message(self, message: str, recipient: Optional[str] = None):
+        self._post([{"recipient": recipient, "message": message}])
+
+    def deliver(self, batch: List[str]):
+        self._post([{"recipient": None, "message": message} for message in batch])
+
+
+class WebhookMessageFormatter(TemplateMessageFormatter):
+    def __init__(self, template: str = "{message}", cache: bool = True):
+        super().__init__(template, cache)
+
+
+class WebhookNotificationFactory(NotificationFactory):
+    channel = "webhook"
+
+    def __init__(self, url: Optional[str] = None):
+        self.url = url
+
+    def create_sender(self) -> MessageSender:
+        return WebhookMessageSender(self.url)
+
+    def create_formatter(self) -> MessageFormatter:
+        return WebhookMessageFormatter()
+
+
+# ============================================================
+# 3. IN-APP FAMILY
+# ============================================================
+
+class InAppMessageSender(MessageSender):
+    # messages land in a per-recipient inbox the app reads on its next poll
+    def __init__(self, inboxes: Dict[Optional[str], List[str]]):
+        self.inboxes = inboxes
+
+    def send_message(self, message: str, recipient: Optional[str] = None):
+        self.inboxes[recipient].append(message)
+
+    def send_batch(self, messages: List[str]):
+        self.inboxes[None].extend(messages)
+
+
+class InAppMessageFormatter(TemplateMessageFormatter):
+    def __init__(self, template: str = "[IN-APP FORMAT] {message}", cache: bool = True):
+        super().__init__(template, cache)
+
+
+class InAppNotificationFactory(NotificationFactory):
+    channel = "in-app"
+
+    def __init__(self):
+        self.inboxes = defaultdict(list)
+
+    def create_sender(self) -> MessageSender:
+        return InAppMessageSender(self.inboxes)
+
+    def create_formatter(self) -> MessageFormatter:
+        return InAppMessageFormatter()
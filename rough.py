@@ -1,23 +1,225 @@
+import asyncio
+import decimal
+import math
+import mmap
+import os
+import random
+import struct
+import sys
+import tempfile
+import threading
+import time
+import timeit
 from abc import ABC,abstractmethod
+from array import array
+from collections import OrderedDict
+from functools import total_ordering
+from zlib import crc32
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional, batches fall back to array('d')
+    np = None
+
+# MONEY
+# number of minor-unit digits; currencies not listed here use 2
+_CURRENCY_EXPONENTS = {"JPY": 0, "KRW": 0, "VND": 0, "BHD": 3, "KWD": 3, "OMR": 3}
+_SCALES = {exponent: 10 ** exponent for exponent in set(_CURRENCY_EXPONENTS.values()) | {2}}
+
+@total_ordering
+class Money:
+    # integer minor units + currency code. Parsing, arithmetic and formatting
+    # stay on ints; decimal.Decimal is only used to round inputs that carry
+    # more precision than the currency has (e.g. "10.005" INR or 0.1 * 3.33)
+    __slots__ = ("minor", "currency")
+
+    def __init__(self, minor: int, currency: str = "INR"):
+        self.minor = minor
+        self.currency = currency
+
+    @staticmethod
+    def exponent(currency: str) -> int:
+        return _CURRENCY_EXPONENTS.get(currency, 2)
+
+    @classmethod
+    def parse(cls, text: str, currency: str = "INR") -> "Money":
+        exponent = _CURRENCY_EXPONENTS.get(currency, 2)
+        whole, _, frac = text.partition(".")
+        if len(frac) <= exponent and (frac or whole[-1:].isdecimal()):
+            # "-12.3" -> int("-1230"): one int() call, no Decimal
+            digits = whole + frac + "0" * (exponent - len(frac))
+            if (digits[1:] if digits[0] in "+-" else digits).isdecimal():
+                return cls(int(digits), currency)
+        try:
+            return cls._from_decimal(decimal.Decimal(text), currency)
+        except (decimal.InvalidOperation, ValueError, OverflowError):
+            raise ValueError(f"Invalid money amount: {text!r}") from None
+
+    @classmethod
+    def from_float(cls, amount: float, currency: str = "INR") -> "Money":
+        # nearest minor unit of the float value (12.34 -> 1234)
+        return cls(round(amount * _SCALES[_CURRENCY_EXPONENTS.get(currency, 2)]), currency)
+
+    @classmethod
+    def _from_decimal(cls, amount: decimal.Decimal, currency: str) -> "Money":
+        minor = amount.scaleb(cls.exponent(currency)).to_integral_value(decimal.ROUND_HALF_EVEN)
+        return cls(int(minor), currency)
+
+    def to_decimal(self) -> decimal.Decimal:
+        return decimal.Decimal(self.minor).scaleb(-self.exponent(self.currency))
+
+    def _check_currency(self, other: "Money"):
+        if self.currency != other.currency:
+            raise ValueError(f"Currency mismatch: {self.currency} vs {other.currency}")
+
+    def __add__(self, other: "Money") -> "Money":
+        if not isinstance(other, Money):
+            return NotImplemented
+        self._check_currency(other)
+        return Money(self.minor + other.minor, self.currency)
+
+    def __sub__(self, other: "Money") -> "Money":
+        if not isinstance(other, Money):
+            return NotImplemented
+        self._check_currency(other)
+        return Money(self.minor - other.minor, self.currency)
+
+    def __mul__(self, factor) -> "Money":
+        if isinstance(factor, int):
+            return Money(self.minor * factor, self.currency)
+        if isinstance(factor, (float, decimal.Decimal)):
+            minor = (decimal.Decimal(self.minor) * decimal.Decimal(factor)).to_integral_value(
+                decimal.ROUND_HALF_EVEN)
+            return Money(int(minor), self.currency)
+        return NotImplemented
+
+    __rmul__ = __mul__
+
+    def __neg__(self) -> "Money":
+        return Money(-self.minor, self.currency)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Money):
+            return NotImplemented
+        return self.minor == other.minor and self.currency == other.currency
+
+    def __lt__(self, other: "Money") -> bool:
+        if not isinstance(other, Money):
+            return NotImplemented
+        self._check_currency(other)
+        return self.minor < other.minor
+
+    def __hash__(self) -> int:
+        return hash((self.minor, self.currency))
+
+    def __str__(self) -> str:
+        exponent = _CURRENCY_EXPONENTS.get(self.currency, 2)
+        minor = self.minor
+        sign = "-" if minor < 0 else ""
+        if exponent == 2:
+            whole, frac = divmod(abs(minor), 100)
+            return f"{sign}{whole}.{frac:02d} {self.currency}"
+        if exponent == 0:
+            return f"{sign}{abs(minor)} {self.currency}"
+        whole, frac = divmod(abs(minor), _SCALES[exponent])
+        return f"{sign}{whole}.{frac:0{exponent}d} {self.currency}"
+
+    def __repr__(self) -> str:
+        return f"Money({self.minor}, {self.currency!r})"
+
 # abstractProduct
 
 class Payment(ABC):
+    # payment type and text every result of this payment method starts with
+    method = ""
+    prefix = ""
+    # set Payment.ledger to a PaymentLedger to record every processed payment
+    ledger = None
+
     @abstractmethod
-    def process_payment(self,amount: float):
+    def process_payment(self,amount: "float | Money", account: str = None):
         pass
 
+    def process_batch(self, amounts, account: str = None) -> "PaymentBatchResult":
+        # amounts: any sequence of numbers or Money, array('d') or numpy array
+        if isinstance(amounts, (list, tuple)) and amounts and isinstance(amounts[0], Money):
+            result = PaymentBatchResult(self.prefix, *_as_minor_column(amounts))
+        else:
+            result = PaymentBatchResult(self.prefix, _as_amount_column(amounts))
+        if self.ledger is not None:
+            self.ledger.extend(account, self.method, amounts)
+        return result
+
 #CONCRETE PRODUCTS
 class creditCardPayment(Payment):
-    def process_payment(self,amount: float):
-        return "Payment Done through CreditCard"+str(amount)
+    method = "Card"
+    prefix = "Payment Done through CreditCard"
+
+    def process_payment(self,amount: "float | Money", account: str = None):
+        if self.ledger is not None:
+            self.ledger.append(account, self.method, amount)
+        return self.prefix+str(amount)
     
 class UPIPayment(Payment):
-    def process_payment(self,amount: float):
-        return "Payment Done through UPI:"+str(amount)
+    method = "UPI"
+    prefix = "Payment Done through UPI:"
+
+    def process_payment(self,amount: "float | Money", account: str = None):
+        if self.ledger is not None:
+            self.ledger.append(account, self.method, amount)
+        return self.prefix+str(amount)
     
 class NetBankingPayment(Payment):
-    def process_payment(self,amount: float):
-        return "Payment Done through NETBanking"+str(amount)
+    method = "Net"
+    prefix = "Payment Done through NETBanking"
+
+    def process_payment(self,amount: "float | Money", account: str = None):
+        if self.ledger is not None:
+            self.ledger.append(account, self.method, amount)
+        return self.prefix+str(amount)
+
+# batch results
+def _as_amount_column(amounts):
+    # float64 columns are used as-is (no copy), anything else is packed once
+    if np is not None and isinstance(amounts, np.ndarray):
+        return np.ascontiguousarray(amounts, dtype=np.float64)
+    if isinstance(amounts, array) and amounts.typecode == "d":
+        return amounts
+    return array("d", amounts)
+
+def _as_minor_column(amounts):
+    # Money batches become an int64 column of minor units in one currency
+    currency = amounts[0].currency
+    if any(amount.currency != currency for amount in amounts):
+        raise ValueError("A payment batch must use a single currency")
+    return array("q", [amount.minor for amount in amounts]), currency
+
+class PaymentBatchResult:
+    # columnar result of process_batch: one prefix for the whole batch plus
+    # the amount column (float64, or int64 minor units when `currency` is
+    # set). The per-row text of process_payment is only built when a single
+    # row is read.
+    __slots__ = ("prefix", "amounts", "currency")
+
+    def __init__(self, prefix: str, amounts, currency: str = None):
+        self.prefix = prefix
+        self.amounts = amounts
+        self.currency = currency
+
+    def __len__(self) -> int:
+        return len(self.amounts)
+
+    def __getitem__(self, index: int) -> str:
+        if self.currency is not None:
+            return self.prefix + str(Money(self.amounts[index], self.currency))
+        return self.prefix + str(float(self.amounts[index]))
+
+    def total(self) -> "float | Money":
+        if self.currency is not None:
+            return Money(sum(self.amounts), self.currency)
+        if np is not None and isinstance(self.amounts, np.ndarray):
+            return float(self.amounts.sum())
+        return math.fsum(self.amounts)
 
 # abstract Factory
 class PaymentFactory(ABC):
@@ -25,27 +227,786 @@ class PaymentFactory(ABC):
     def create_payment(self,payment_type: str):
         pass
 
+# factory registry
+# payment type -> one shared factory instance (factories are stateless),
+# so resolving a type is a single dict lookup instead of an if/elif chain
+class PaymentFactoryRegistry:
+    def __init__(self):
+        self._factories = {}
+
+    def register(self, factory_type: str):
+        def decorator(factory_cls):
+            if factory_type in self._factories:
+                raise ValueError(f"Payment type already registered: {factory_type}")
+            self._factories[factory_type] = factory_cls()
+            return factory_cls
+        return decorator
+
+    def get(self, factory_type: str) -> PaymentFactory:
+        try:
+            return self._factories[factory_type]
+        except KeyError:
+            raise ValueError(f"Unsupported payment type: {factory_type}") from None
+
+    def __contains__(self, factory_type: str) -> bool:
+        return factory_type in self._factories
+
+    def __len__(self) -> int:
+        return len(self._factories)
+
+
+payment_registry = PaymentFactoryRegistry()
+
 #concrete Factories
+@payment_registry.register("Card")
 class creditCardPaymentFactory(PaymentFactory):
     def create_payment(self):
         return creditCardPayment()
 
+@payment_registry.register("UPI")
 class UPIPaymentFactory(PaymentFactory):
     def create_payment(self):
         return UPIPayment()
     
+@payment_registry.register("Net")
 class NetBankingPaymentFactory(PaymentFactory):
     def create_payment(self):
         return NetBankingPayment()
-    
 
-def get_factory(factory_type: str):
-    if factory_type == "Card":
-        return creditCardPaymentFactory()
-    elif factory_type == "UPI":
-        return UPIPaymentFactory()
-    elif factory_type == "Net":
-        return NetBankingPaymentFactory()
-    
-factory = get_factory('Card')
-print(factory.create_payment().process_payment(1500))
+
+def get_factory(factory_type: str) -> PaymentFactory:
+    return payment_registry.get(factory_type)
+
+
+# ASYNC PAYMENTS
+# gateway calls are I/O bound, so the async products await the gateway
+# instead of blocking a thread per payment
+class FakePaymentGateway:
+    # local stand-in for a payment gateway with configurable latency
+    def __init__(self, latency: float = 0.01, jitter: float = 0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.calls = 0
+        self.calls_by_method = {}
+
+    async def charge(self, method: str, amount: float):
+        self.calls += 1
+        self.calls_by_method[method] = self.calls_by_method.get(method, 0) + 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency + random.uniform(0, self.jitter))
+        finally:
+            self.in_flight -= 1
+
+# async abstractProduct
+class AsyncPayment(ABC):
+    method = ""
+    prefix = ""
+    ledger = None
+
+    def __init__(self, gateway):
+        self.gateway = gateway
+
+    @abstractmethod
+    async def process_payment(self, amount: "float | Money", account: str = None):
+        pass
+
+class AsyncCreditCardPayment(AsyncPayment):
+    method = creditCardPayment.method
+    prefix = creditCardPayment.prefix
+
+    async def process_payment(self, amount: "float | Money", account: str = None):
+        await self.gateway.charge(self.method, amount)
+        if self.ledger is not None:
+            self.ledger.append(account, self.method, amount)
+        return self.prefix+str(amount)
+
+class AsyncUPIPayment(AsyncPayment):
+    method = UPIPayment.method
+    prefix = UPIPayment.prefix
+
+    async def process_payment(self, amount: "float | Money", account: str = None):
+        await self.gateway.charge(self.method, amount)
+        if self.ledger is not None:
+            self.ledger.append(account, self.method, amount)
+        return self.prefix+str(amount)
+
+class AsyncNetBankingPayment(AsyncPayment):
+    method = NetBankingPayment.method
+    prefix = NetBankingPayment.prefix
+
+    async def process_payment(self, amount: "float | Money", account: str = None):
+        await self.gateway.charge(self.method, amount)
+        if self.ledger is not None:
+            self.ledger.append(account, self.method, amount)
+        return self.prefix+str(amount)
+
+# async abstract Factory
+class AsyncPaymentFactory(ABC):
+    def __init__(self, gateway):
+        self.gateway = gateway
+
+    @abstractmethod
+    def create_payment(self) -> AsyncPayment:
+        pass
+
+class AsyncCreditCardPaymentFactory(AsyncPaymentFactory):
+    def create_payment(self) -> AsyncPayment:
+        return AsyncCreditCardPayment(self.gateway)
+
+class AsyncUPIPaymentFactory(AsyncPaymentFactory):
+    def create_payment(self) -> AsyncPayment:
+        return AsyncUPIPayment(self.gateway)
+
+class AsyncNetBankingPaymentFactory(AsyncPaymentFactory):
+    def create_payment(self) -> AsyncPayment:
+        return AsyncNetBankingPayment(self.gateway)
+
+
+def get_async_factories(gateway) -> dict:
+    return {
+        "Card": AsyncCreditCardPaymentFactory(gateway),
+        "UPI": AsyncUPIPaymentFactory(gateway),
+        "Net": AsyncNetBankingPaymentFactory(gateway),
+    }
+
+
+class PaymentMethodStats:
+    __slots__ = ("count", "failed", "latency")
+
+    def __init__(self):
+        self.count = 0
+        self.failed = 0
+        self.latency = 0.0
+
+class PipelineReport:
+    def __init__(self, stats: dict, elapsed: float):
+        self.stats = stats
+        self.elapsed = elapsed
+
+    def throughput(self, method: str) -> float:
+        # completed payments per second of pipeline wall time
+        return self.stats[method].count / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self) -> str:
+        lines = []
+        for method, stats in sorted(self.stats.items()):
+            avg = stats.latency / stats.count * 1e3 if stats.count else 0.0
+            lines.append(f"{method:<5} done={stats.count} failed={stats.failed}"
+                         f" {self.throughput(method):10.0f}/s avg={avg:.2f} ms")
+        return "\n".join(lines)
+
+
+async def run_payment_pipeline(jobs, factories: dict, concurrency: int = 100) -> PipelineReport:
+    # jobs: iterable of (payment type, amount). At most `concurrency` payments
+    # are in flight; the bounded queue makes the producer wait when all
+    # workers are busy, so a huge job list is never buffered in memory.
+    payments = {method: factory.create_payment() for method, factory in factories.items()}
+    stats = {method: PaymentMethodStats() for method in payments}
+    queue = asyncio.Queue(maxsize=concurrency)
+
+    async def worker():
+        while True:
+            job = await queue.get()
+            if job is None:
+                return
+            method, amount = job
+            method_stats = stats[method]
+            start = time.perf_counter()
+            try:
+                await payments[method].process_payment(amount)
+            except Exception:
+                method_stats.failed += 1
+            else:
+                method_stats.count += 1
+                method_stats.latency += time.perf_counter() - start
+
+    start = time.perf_counter()
+    workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+    try:
+        for method, amount in jobs:
+            if method not in payments:
+                raise ValueError(f"Unsupported payment type: {method}")
+            await queue.put((method, amount))
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+    finally:
+        for task in workers:
+            task.cancel()
+    return PipelineReport(stats, time.perf_counter() - start)
+
+def verify_payment_pipeline(payments=300, concurrency=8):
+    # runs the pipeline against the fake gateway and checks the in-flight
+    # limit, that the producer is held back, and the per-method counts
+    methods = ("Card", "UPI", "UPI", "Net")
+    gateway = FakePaymentGateway(latency=0.001, jitter=0.001)
+    lead = 0
+
+    def jobs():
+        nonlocal lead
+        for i in range(payments):
+            # jobs pulled but not yet charged: the queue plus the one being put
+            lead = max(lead, i + 1 - gateway.calls)
+            yield methods[i % len(methods)], float(i)
+
+    report = asyncio.run(run_payment_pipeline(jobs(), get_async_factories(gateway), concurrency))
+    expected = {method: sum(1 for i in range(payments) if methods[i % len(methods)] == method)
+                for method in set(methods)}
+    assert gateway.max_in_flight <= concurrency, gateway.max_in_flight
+    assert lead <= concurrency + 1, lead
+    assert gateway.calls == payments and gateway.calls_by_method == expected
+    assert {method: stats.count for method, stats in report.stats.items()} == expected
+    assert all(stats.failed == 0 for stats in report.stats.values())
+    try:
+        asyncio.run(run_payment_pipeline([("Cash", 1.0)], get_async_factories(gateway)))
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("unknown payment type was accepted")
+    print(f"payment pipeline: ok (in-flight peak={gateway.max_in_flight}, producer lead={lead})")
+
+# IDEMPOTENCY
+# upstream retries reuse the idempotency key of the original request, so the
+# first result is stored and replayed instead of charging twice
+class _PendingResult:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class IdempotencyCache:
+    # bounded LRU (OrderedDict) with a fixed TTL per entry. Concurrent calls
+    # with a key that is still being processed wait for that call instead of
+    # running again. Failures are not cached, so a later retry runs again.
+    def __init__(self, maxsize: int = 100_000, ttl: float = 24 * 3600, clock=time.monotonic):
+        if maxsize <= 0:
+            raise ValueError("maxsize must be positive")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._results = OrderedDict()  # key -> (expires_at, result)
+        self._pending = {}             # key -> _PendingResult
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def run(self, key: str, call, *args):
+        with self._lock:
+            entry = self._results.get(key)
+            if entry is not None:
+                if entry[0] > self._clock():
+                    self._results.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._results[key]
+            pending = self._pending.get(key)
+            owner = pending is None
+            if owner:
+                pending = self._pending[key] = _PendingResult()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not owner:
+            pending.done.wait()
+            if pending.error is not None:
+                raise pending.error
+            return pending.result
+
+        try:
+            pending.result = call(*args)
+        except BaseException as error:
+            pending.error = error
+            raise
+        else:
+            self._store(key, pending.result)
+        finally:
+            with self._lock:
+                del self._pending[key]
+            pending.done.set()
+        return pending.result
+
+    def _store(self, key: str, result):
+        now = self._clock()
+        with self._lock:
+            self._results[key] = (now + self.ttl, result)
+            results = self._results
+            # drop expired entries from the LRU end, then enforce the size bound
+            while results:
+                oldest = next(iter(results.values()))
+                if oldest[0] > now and len(results) <= self.maxsize:
+                    break
+                results.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._results)
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "coalesced": self.coalesced,
+                "size": len(self._results)}
+
+class IdempotentPayment(Payment):
+    # wraps any Payment product; calls without a key go straight through
+    def __init__(self, payment: Payment, cache: IdempotencyCache):
+        self.payment = payment
+        self.cache = cache
+        self.method = payment.method
+        self.prefix = payment.prefix
+
+    def process_payment(self, amount: "float | Money", account: str = None,
+                        idempotency_key: str = None):
+        if idempotency_key is None:
+            return self.payment.process_payment(amount, account)
+        return self.cache.run(idempotency_key, self.payment.process_payment, amount, account)
+
+    def process_batch(self, amounts, account: str = None) -> "PaymentBatchResult":
+        return self.payment.process_batch(amounts, account)
+
+class IdempotentPaymentFactory(PaymentFactory):
+    # every product of the wrapped factory shares one cache
+    def __init__(self, factory: PaymentFactory, cache: IdempotencyCache = None):
+        self.factory = factory
+        self.cache = cache if cache is not None else IdempotencyCache()
+
+    def create_payment(self) -> IdempotentPayment:
+        return IdempotentPayment(self.factory.create_payment(), self.cache)
+
+# PAYMENT LEDGER
+# append-only record of processed payments. Entries are sharded by account
+# hash and every shard has its own lock, so writers for different accounts
+# rarely contend on the same mutex.
+class PaymentLedger:
+    def __init__(self, shards: int = 64):
+        if shards <= 0 or shards & (shards - 1):
+            raise ValueError("shards must be a power of two")
+        self._mask = shards - 1
+        self._locks = [threading.Lock() for _ in range(shards)]
+        self._shards = [[] for _ in range(shards)]
+
+    def append(self, account: str, method: str, amount: "float | Money"):
+        index = hash(account) & self._mask
+        with self._locks[index]:
+            self._shards[index].append((account, method, amount))
+
+    def extend(self, account: str, method: str, amounts):
+        # a whole batch for one account takes its shard lock once
+        index = hash(account) & self._mask
+        with self._locks[index]:
+            self._shards[index].extend([(account, method, amount) for amount in amounts])
+
+    def snapshot(self, account: str = None) -> list:
+        # (account, method, amount) entries; in write order per account
+        if account is not None:
+            index = hash(account) & self._mask
+            with self._locks[index]:
+                return [entry for entry in self._shards[index] if entry[0] == account]
+        # all shard locks are held together (always in index order, writers
+        # only ever hold one) so the copy is a single point in time
+        for lock in self._locks:
+            lock.acquire()
+        try:
+            return [entry for shard in self._shards for entry in shard]
+        finally:
+            for lock in self._locks:
+                lock.release()
+
+    def __len__(self) -> int:
+        return sum(len(shard) for shard in self._shards)
+
+# WRITE-AHEAD LOG
+# durable payment records in fixed-size, pre-allocated segment files that
+# are written through mmap. Commits are grouped: the dirty range is synced
+# once per `commit_rows` records or `commit_interval` seconds instead of
+# fsync per row. A committer thread syncs the tail every `commit_interval`
+# seconds, so records appended just before the log goes idle still become
+# durable; commit_interval=0 syncs on every write and needs no committer. Same append/extend interface as PaymentLedger, so it can be
+# used as Payment.ledger.
+#
+# record = header <II> (payload length, crc32 of payload) + payload
+# payload = <QBd> seq, 0, float amount            (floats / ints)
+#         | <QBq> seq, 1, minor units + currency  (Money)
+#         followed by method and account as <H> length + utf-8 bytes
+#         (account length 0xFFFF means None)
+# A zero length field marks the end of the written part of a segment.
+_WAL_HEADER = struct.Struct("<II")
+_WAL_FLOAT = struct.Struct("<QBd")
+_WAL_MONEY = struct.Struct("<QBq")
+_WAL_TEXT = struct.Struct("<H")
+_WAL_NONE = 0xFFFF
+
+def _wal_text(text: str) -> bytes:
+    if text is None:
+        return _WAL_TEXT.pack(_WAL_NONE)
+    data = text.encode()
+    return _WAL_TEXT.pack(len(data)) + data
+
+def _wal_read_text(payload, offset: int):
+    (length,) = _WAL_TEXT.unpack_from(payload, offset)
+    offset += _WAL_TEXT.size
+    if length == _WAL_NONE:
+        return None, offset
+    return bytes(payload[offset:offset + length]).decode(), offset + length
+
+def _wal_decode(payload):
+    seq, kind, amount = _WAL_FLOAT.unpack_from(payload)
+    offset = _WAL_FLOAT.size
+    if kind == 1:
+        seq, kind, minor = _WAL_MONEY.unpack_from(payload)
+        currency, offset = _wal_read_text(payload, offset)
+        amount = Money(minor, currency)
+    method, offset = _wal_read_text(payload, offset)
+    account, offset = _wal_read_text(payload, offset)
+    return seq, account, method, amount
+
+
+class PaymentWAL:
+    def __init__(self, directory: str, segment_size: int = 16 * 1024 * 1024,
+                 commit_rows: int = 1000, commit_interval: float = 0.01):
+        if segment_size % mmap.PAGESIZE:
+            raise ValueError("segment_size must be a multiple of mmap.PAGESIZE")
+        self.directory = directory
+        self.segment_size = segment_size
+        self.commit_rows = commit_rows
+        self.commit_interval = commit_interval
+        self._lock = threading.Lock()
+        self._file = None
+        self._map = None
+        os.makedirs(directory, exist_ok=True)
+        self.recovered, self.next_seq, segment, position = self._recover()
+        self._open_segment(segment, position)
+        self._closing = threading.Event()
+        self._committer = None
+        if commit_interval > 0:
+            self._committer = threading.Thread(target=self._commit_idle, name="wal-commit", daemon=True)
+            self._committer.start()
+
+    # recovery
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.directory, f"wal-{segment:08d}.seg")
+
+    def _segments(self) -> list:
+        names = sorted(name for name in os.listdir(self.directory)
+                       if name.startswith("wal-") and name.endswith(".seg"))
+        return [int(name[4:-4]) for name in names]
+
+    @staticmethod
+    def _scan(view, size: int):
+        # yields (end offset, payload) for every valid record in a segment
+        position = 0
+        while position + _WAL_HEADER.size <= size:
+            length, checksum = _WAL_HEADER.unpack_from(view, position)
+            end = position + _WAL_HEADER.size + length
+            if length == 0 or end > size:
+                return
+            payload = view[position + _WAL_HEADER.size:end]
+            if crc32(payload) != checksum:
+                return  # torn write: the log ends here
+            yield end, payload
+            position = end
+
+    def _recover(self):
+        # one pass over the segments to find the tail; only the last record's
+        # seq is decoded. Anything after the first invalid record is dropped.
+        count, last_seq, segment, position = 0, 0, 1, 0
+        segments = self._segments()
+        for index, segment in enumerate(segments):
+            path = self._segment_path(segment)
+            if os.path.getsize(path) == 0:
+                # created but never sized (crash before truncate): empty
+                position, clean = 0, True
+            else:
+                with open(path, "rb") as file, \
+                        mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                    position, payload = 0, None
+                    for position, payload in self._scan(view, len(view)):
+                        count += 1
+                    if payload is not None:
+                        (last_seq,) = struct.unpack_from("<Q", payload)
+                    # a clean segment ends in zeros (or exactly at its end);
+                    # anything else is a torn write and the log stops there
+                    clean = position + _WAL_HEADER.size > len(view) or \
+                        _WAL_HEADER.unpack_from(view, position)[0] == 0
+            if not clean or index == len(segments) - 1:
+                for later in segments[index + 1:]:
+                    os.remove(self._segment_path(later))
+                break
+        return count, last_seq + 1, segment, position
+
+    def records(self):
+        # replays every durable record as (seq, account, method, amount)
+        self.commit()
+        for segment in self._segments():
+            with open(self._segment_path(segment), "rb") as file, \
+                    mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                for _, payload in self._scan(view, len(view)):
+                    yield _wal_decode(payload)
+
+    # writing
+    def _open_segment(self, segment: int, position: int):
+        path = self._segment_path(segment)
+        existing = os.path.exists(path)
+        self._file = open(path, "r+b" if existing else "w+b")
+        if os.fstat(self._file.fileno()).st_size != self.segment_size:
+            self._file.truncate(self.segment_size)
+            os.fsync(self._file.fileno())
+        if not existing:
+            # the new directory entry has to be durable too, or the segment
+            # (and the records msynced into it) can vanish on power loss
+            directory = os.open(self.directory, os.O_RDONLY)
+            try:
+                os.fsync(directory)
+            finally:
+                os.close(directory)
+        self._map = mmap.mmap(self._file.fileno(), self.segment_size)
+        if existing:
+            # clear whatever a torn write left behind the tail
+            self._map[position:] = bytes(self.segment_size - position)
+        self._segment = segment
+        self._position = position
+        self._synced = position
+        self._pending = 0
+        self._last_commit = time.monotonic()
+
+    def _encode(self, account: str, method: str, amount) -> bytes:
+        seq = self.next_seq
+        self.next_seq += 1
+        if isinstance(amount, Money):
+            head = _WAL_MONEY.pack(seq, 1, amount.minor) + _wal_text(amount.currency)
+        else:
+            head = _WAL_FLOAT.pack(seq, 0, amount)
+        payload = head + _wal_text(method) + _wal_text(account)
+        return _WAL_HEADER.pack(len(payload), crc32(payload)) + payload
+
+    def _write(self, record: bytes):
+        end = self._position + len(record)
+        if end > self.segment_size:
+            if len(record) > self.segment_size:
+                raise ValueError("Record larger than a WAL segment")
+            self._sync()
+            self._close_segment()
+            self._open_segment(self._segment + 1, 0)
+            end = len(record)
+        self._map[self._position:end] = record
+        self._position = end
+        self._pending += 1
+
+    def _maybe_commit(self):
+        if (self._pending >= self.commit_rows
+                or time.monotonic() - self._last_commit >= self.commit_interval):
+            self._sync()
+
+    def _sync(self):
+        if self._position > self._synced:
+            # msync needs a page-aligned start
+            start = self._synced - self._synced % mmap.PAGESIZE
+            self._map.flush(start, self._position - start)
+            self._synced = self._position
+        self._pending = 0
+        self._last_commit = time.monotonic()
+
+    def _commit_idle(self):
+        # the write path only checks commit_interval when it writes; this
+        # covers the tail once writes stop
+        while not self._closing.wait(self.commit_interval):
+            with self._lock:
+                if self._map is not None and self._position > self._synced:
+                    self._sync()
+
+    def _close_segment(self):
+        self._map.close()
+        self._file.close()
+
+    def append(self, account: str, method: str, amount):
+        with self._lock:
+            self._write(self._encode(account, method, amount))
+            self._maybe_commit()
+
+    def extend(self, account: str, method: str, amounts):
+        with self._lock:
+            for amount in amounts:
+                self._write(self._encode(account, method, amount))
+            self._maybe_commit()
+
+    def commit(self):
+        with self._lock:
+            self._sync()
+
+    def close(self):
+        self._closing.set()
+        with self._lock:
+            if self._map is not None:
+                self._sync()
+                self._close_segment()
+                self._map = None
+
+# BENCHMARKS
+# registry lookup vs the old if/elif chain
+def _if_chain(factory_types):
+    # same cost model as the old get_factory: compare one type at a time
+    # and build a fresh factory on every call
+    def get(factory_type: str):
+        for name, factory_cls in factory_types:
+            if factory_type == name:
+                return factory_cls()
+    return get
+
+def benchmark_get_factory(sizes=(3, 30, 300), lookups=100_000):
+    for size in sizes:
+        factory_types = [(f"Type{i}", creditCardPaymentFactory) for i in range(size)]
+        registry = PaymentFactoryRegistry()
+        for name, factory_cls in factory_types:
+            registry.register(name)(factory_cls)
+        chain = _if_chain(factory_types)
+        # worst case for the chain: the last registered type
+        last = factory_types[-1][0]
+
+        chain_time = timeit.timeit(lambda: chain(last), number=lookups)
+        registry_time = timeit.timeit(lambda: registry.get(last), number=lookups)
+        print(f"{size:>4} types | if/elif: {chain_time / lookups * 1e9:8.0f} ns/call"
+              f" | registry: {registry_time / lookups * 1e9:6.0f} ns/call")
+
+
+def benchmark_process_batch(size=1_000_000):
+    payment = get_factory("UPI").create_payment()
+    amounts = [float(i % 10_000) + 0.5 for i in range(size)]
+    inputs = [("list", amounts), ("array('d')", array("d", amounts))]
+    if np is not None:
+        inputs.append(("numpy", np.asarray(amounts)))
+
+    loop_time = timeit.timeit(
+        lambda: [payment.process_payment(amount) for amount in amounts], number=1)
+    print(f"process_payment loop      : {loop_time * 1e3:8.1f} ms for {size} amounts")
+    for label, batch in inputs:
+        batch_time = timeit.timeit(lambda: payment.process_batch(batch).total(), number=1)
+        print(f"process_batch {label:<10}: {batch_time * 1e3:8.1f} ms for {size} amounts")
+
+def benchmark_payment_pipeline(payments=5_000, latencies=(0.001, 0.01), concurrency=(10, 100, 1000)):
+    methods = ("Card", "UPI", "Net")
+    for latency in latencies:
+        for limit in concurrency:
+            gateway = FakePaymentGateway(latency=latency, jitter=latency / 2)
+            jobs = ((methods[i % 3], float(i)) for i in range(payments))
+            report = asyncio.run(run_payment_pipeline(jobs, get_async_factories(gateway), limit))
+            assert gateway.max_in_flight <= limit
+            print(f"latency={latency * 1e3:.0f} ms concurrency={limit}"
+                  f" in-flight peak={gateway.max_in_flight} elapsed={report.elapsed:.2f} s")
+            print(report)
+
+def benchmark_money(transactions=200_000):
+    payment = get_factory("Card").create_payment()
+    floats = [(i % 100_000) / 100 + 0.01 for i in range(transactions)]
+    texts = [f"{amount:.2f}" for amount in floats]
+    amounts = [Money.parse(text) for text in texts]
+    cent = decimal.Decimal("0.01")
+
+    def float_path():
+        # old path: float in, str() out, then normalise to 2 places afterwards
+        for amount in floats:
+            payment.process_payment(amount)
+            decimal.Decimal(str(amount)).quantize(cent)
+
+    def money_path():
+        for amount in amounts:
+            payment.process_payment(amount)
+
+    def parse_path():
+        for text in texts:
+            payment.process_payment(Money.parse(text))
+
+    paths = (("float + str + Decimal", float_path), ("Money", money_path),
+             ("Money.parse + Money", parse_path))
+    for label, path in paths:
+        elapsed = timeit.timeit(path, number=1)
+        print(f"{label:<22}: {elapsed / transactions * 1e9:6.0f} ns/transaction")
+
+def benchmark_idempotency(threads=32, lookups=200_000):
+    class SlowUPIPayment(UPIPayment):
+        calls = 0
+
+        def process_payment(self, amount, account=None):
+            SlowUPIPayment.calls += 1
+            time.sleep(0.05)
+            return super().process_payment(amount, account)
+
+    class SlowUPIPaymentFactory(PaymentFactory):
+        def create_payment(self):
+            return SlowUPIPayment()
+
+    factory = IdempotentPaymentFactory(SlowUPIPaymentFactory())
+    workers = [threading.Thread(target=lambda: factory.create_payment().process_payment(
+                   100, idempotency_key="order-1"))
+               for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    print(f"{threads} concurrent retries -> {SlowUPIPayment.calls} real call(s), {factory.cache.stats()}")
+
+    payment = factory.create_payment()
+    elapsed = timeit.timeit(lambda: payment.process_payment(100, idempotency_key="order-1"),
+                            number=lookups)
+    print(f"cached replay: {elapsed / lookups * 1e9:.0f} ns/call")
+
+def benchmark_ledger(thread_counts=(1, 2, 4, 8, 16, 32), writes=400_000, shard_counts=(1, 64)):
+    # total work is fixed; shards=1 is the single-mutex baseline
+    for shards in shard_counts:
+        for thread_count in thread_counts:
+            ledger = PaymentLedger(shards)
+            per_thread = writes // thread_count
+
+            def writer(worker: int):
+                append = ledger.append
+                for i in range(per_thread):
+                    append(f"acct-{worker}-{i % 1000}", "UPI", 100.0)
+
+            threads = [threading.Thread(target=writer, args=(worker,)) for worker in range(thread_count)]
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+            print(f"shards={shards:<3} writers={thread_count:<3}"
+                  f" {len(ledger) / elapsed:12.0f} appends/s")
+
+def benchmark_wal(rows=200_000, commit_windows=(1, 10, 100, 1000, 10_000)):
+    for commit_rows in commit_windows:
+        with tempfile.TemporaryDirectory() as directory:
+            # small windows are slow (one msync each), so they get fewer rows
+            count = min(rows, commit_rows * 2_000)
+            wal = PaymentWAL(directory, commit_rows=commit_rows, commit_interval=1.0)
+            start = time.perf_counter()
+            for i in range(count):
+                wal.append(f"acct-{i % 1000}", "UPI", 100.0)
+            wal.close()
+            elapsed = time.perf_counter() - start
+
+            start = time.perf_counter()
+            recovered = PaymentWAL(directory)
+            recovery = time.perf_counter() - start
+            assert recovered.recovered == count
+            recovered.close()
+            print(f"commit every {commit_rows:>6} rows: {count / elapsed:10.0f} rows/s"
+                  f" | recovery scan of {count} rows: {recovery * 1e3:6.1f} ms")
+
+
+if __name__ == "__main__":
+    factory = get_factory('Card')
+    print(factory.create_payment().process_payment(1500))
+    verify_payment_pipeline()
+
+    if "--bench" in sys.argv:
+        benchmark_get_factory()
+        benchmark_process_batch()
+        benchmark_payment_pipeline()
+        benchmark_money()
+        benchmark_idempotency()
+        benchmark_ledger()
+        benchmark_wal()